@@ -1,17 +1,23 @@
-import glob
-
 import streamlit as st
-from langchain_core.messages.system import SystemMessage
 
-from chatbot.graph import build_graph
+from chatbot.resources import get_graph, warm_up
+from chatbot.settings import get_setting
+from chatbot.threads import resume_thread, start_thread, thread_registry
+from components.adminPage import loadAdminPage
+from components.casePages import getCasePages
+from components.transcript import Transcript
 # page config
 st.set_page_config(page_title="DIIR Chatbot Demo", layout="wide")
 
+# Graph and API clients are built once per process and shared by all sessions
+warm_up()
+
 # Initialize session state variables
-graph = build_graph()
+# Chat history of the CustomGPT case page; the LangChain case pages read theirs from the graph thread
 if "messages" not in st.session_state:
-    st.session_state.messages = [
-        {"role": "assistant", "content": "Hi, I'm Dr.XRLiA. You can submit your answers for this case to me and I'll evaluate them! \n Feel free to ask me questions related to lines and tubes on CXRs as well."}]
+    st.session_state.messages = Transcript(
+        "Hi, I'm Dr.XRLiA. You can submit your answers for this case to me and I'll evaluate them! \n Feel free to ask me questions related to lines and tubes on CXRs as well.",
+        pageSize=get_setting("TRANSCRIPT_PAGE_SIZE", 20))
 
 if "currentStage" not in st.session_state:
     st.session_state.currentStage = 1
@@ -20,18 +26,21 @@ if "currentCase" not in st.session_state:
     st.session_state.currentCase = 0
 
 if 'sessionID' not in st.session_state:
-    st.session_state.sessionID = 2514216  # getNewConversationID()
-
-if 'lcConfig' not in st.session_state:
-    st.session_state.lcConfig = {"configurable": {"thread_id": "abc123"}}
+    st.session_state.sessionID = None  # CustomGPT conversation, created on first message
 
 if "graph" not in st.session_state:
-    st.session_state.graph = graph
-    with open("./data/prompts/sysprompt.txt", "r") as f:
-        sys_prompt = f.read()
-    # system_msg = SystemMessage(sys_prompt)
-    system_msg = SystemMessage(sys_prompt)
-    st.session_state.graph.update_state(config=st.session_state.lcConfig, values={"messages": [system_msg]})
+    st.session_state.graph = get_graph()
+
+# One conversation thread per browser session; a new one is started if it has expired.
+# The thread ID is kept in the URL so a reload or server restart can resume its checkpoints.
+if thread_registry.get(st.session_state.get("threadID")) is None:
+    thread = resume_thread(st.session_state.graph, thread_registry, st.query_params.get("thread"))
+    if thread is None:
+        thread = start_thread(st.session_state.graph, thread_registry)
+    st.session_state.threadID = thread.thread_id
+    st.session_state.lcConfig = thread.config
+    st.query_params["thread"] = thread.thread_id
+    st.session_state.pagesShown = 0
 
 # Set up pages and navigation
 homePage = st.Page("home.py", title="Home")
@@ -39,10 +48,12 @@ homePage = st.Page("home.py", title="Home")
 # pages = [homePage, lcChatPage]
 pages = [homePage]
 
-casePaths = sorted(glob.glob("./cases/*.py"))
-for idx, casePath in enumerate(casePaths):
-    page = st.Page(casePath, title=f"Game {idx+1}")
-    pages.append(page)
+# One page per case in data/cases/*.yml, served from the in-memory case registry
+pages += getCasePages()
+
+# Latency percentiles and recent turn traces, for whoever runs the server (needs ADMIN_PASSWORD)
+if get_setting("ADMIN_PAGE", False):
+    pages.append(st.Page(loadAdminPage, title="Admin", url_path="admin"))
 
 # pages.append(st.Page("./components/embedding.py", title="Embedding"))
 # Page config
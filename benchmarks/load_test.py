@@ -0,0 +1,272 @@
+# Offline load test of the chat graph.
+# N simulated students work through a case at the same time on the shared GraphExecutor, the
+# way LangChainCasePage drives it: free-text questions streamed through coalesce_stream, then a
+# stage submission built by the StageEvaluator. The chat model, embedder and vector store are
+# local stand-ins (CHAT_BACKEND=fake, EMBEDDINGS_BACKEND=stub, VECTOR_BACKEND=local), so no API
+# credits are spent and the numbers only move when graph, streaming or caching code changes.
+#
+#   python -m benchmarks.load_test --sessions 20
+#   python -m benchmarks.load_test --save-baseline benchmarks/baselines/case1.json
+#   python -m benchmarks.load_test --baseline benchmarks/baselines/case1.json   # exits 1 on regression
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+import tempfile
+import platform
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "Where should the tip of the endotracheal tube be on a chest X-ray?",
+    "How do I confirm the position of a nasogastric tube?",
+    "What does a pneumothorax look like on a CXR?",
+    "Which landmarks help assess ETT position?",
+    "What are the signs of a misplaced central venous catheter?",
+    "How far above the carina should the ETT tip sit?",
+]
+
+# Compared against a baseline: lower is better for latencies, higher is better for throughput.
+# p99 is reported but not gated on, it is too noisy over a few hundred turns.
+LOWER_IS_BETTER = ("turn_p50", "turn_p95", "ttft_p50", "ttft_p95")
+HIGHER_IS_BETTER = ("turns_per_second",)
+
+DEFAULTS = {
+    "sessions": 10,
+    "case": 1,
+    "questions_per_stage": 2,
+    "think_time": 0.0,
+    "model_latency": 0.2,
+    "model_jitter": 0.3,
+    "tokens_per_second": 200.0,
+    "answer_words": 60,
+    "failure_rate": 0.0,
+    "corpus_size": 500,
+    "seed": 0,
+}
+
+
+def configure(params: Dict[str, Any], index_path: str) -> None:
+    """Point every resource at its local stand-in. Must run before the first resource is built."""
+    os.environ.update({
+        "CHAT_BACKEND": "fake",
+        "FAKE_CHAT_LATENCY": str(params["model_latency"]),
+        "FAKE_CHAT_LATENCY_JITTER": str(params["model_jitter"]),
+        "FAKE_CHAT_TOKENS_PER_SECOND": str(params["tokens_per_second"]),
+        "FAKE_CHAT_ANSWER_WORDS": str(params["answer_words"]),
+        "FAKE_CHAT_SEED": str(params["seed"]),
+        # Failures of the primary model are absorbed by a healthy fallback tier
+        "FAKE_CHAT_FAILURE_RATE": str(params.get("failure_rate", 0.0)),
+        "CHAT_FALLBACK_MODELS": "fake-fallback" if params.get("failure_rate") else "",
+        "EMBEDDINGS_BACKEND": "stub",
+        "VECTOR_BACKEND": "local",
+        "LOCAL_INDEX_PATH": index_path,
+        "EMBEDDING_CACHE_PATH": "",
+        "CHECKPOINT_BACKEND": "memory",
+        "LLM_REQUESTS_PER_SECOND": "1000",
+        "EXECUTOR_MAX_QUEUE": str(max(64, params["sessions"] * 2)),
+    })
+
+
+def build_corpus(index_path: str, size: int, seed: int) -> None:
+    """Synthetic guide corpus: the case texts plus generated filler chunks."""
+    from langchain_core.documents import Document
+    from chatbot.lexical_index import LexicalIndex
+    from chatbot.local_index import LocalVectorStore, StubEmbeddings
+    from chatbot.manifest import ChunkManifest
+    from schema.registry import CaseRegistry
+
+    texts = []
+    for case in CaseRegistry().cases():
+        texts.append(case.caseDesc)
+        texts.extend(f"{item.question} {item.answer}" for items in case.questions.values() for item in items)
+    rng = random.Random(seed)
+    vocabulary = " ".join(QUESTIONS).lower().replace("?", "").split()
+    while len(texts) < size:
+        texts.append(" ".join(rng.choice(vocabulary) for _ in range(120)))
+    docs = [Document(text, metadata={"source": f"synthetic-{idx}.md"}) for idx, text in enumerate(texts[:size])]
+    ChunkManifest(os.path.join(index_path, "manifest.json")).sync(LocalVectorStore(StubEmbeddings(), path=index_path), docs)
+    LexicalIndex(path=os.path.join(index_path, "lexical")).sync(docs)
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)] if ordered else 0.0
+
+
+def run_session(idx: int, params: Dict[str, Any], case, results: List[Dict[str, Any]]) -> None:
+    from langchain_core.messages import HumanMessage
+    from chatbot.context import stage_message
+    from chatbot.resources import get_executor, get_graph, get_stage_evaluator
+    from chatbot.streaming import StreamStats, coalesce_stream
+    from chatbot.threads import start_thread, thread_registry
+
+    rng = random.Random(params["seed"] + idx)
+    graph = get_graph()
+    thread = start_thread(graph, thread_registry)
+    evaluator = get_stage_evaluator(case.caseNum, case.version, case)
+
+    def turn(kind: str, message) -> None:
+        stats = StreamStats(started=time.perf_counter())
+        chunks = get_executor().stream(thread.thread_id, graph, {"messages": [message]}, config=thread.config)
+        text = "".join(coalesce_stream(chunks, stats=stats))
+        results.append({"kind": kind, "latency": stats.finished - stats.started, "ttft": stats.ttft,
+                        "chars": len(text)})
+        if params["think_time"]:
+            time.sleep(rng.expovariate(1 / params["think_time"]))
+
+    for stage in range(1, case.maxStage + 1):
+        for _ in range(params["questions_per_stage"]):
+            turn("question", HumanMessage(rng.choice(QUESTIONS)))
+        # Half-remembered reference answers, as a student would type them
+        answers = [" ".join(item.answer.split()[:max(3, len(item.answer.split()) // 2)])
+                   for item in case.questions[f"stage{stage}"]]
+        turn("submission", stage_message(evaluator.build_submission(stage, answers), stage))
+
+
+def run(params: Dict[str, Any]) -> Dict[str, Any]:
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    # The synthetic index only lives for this run
+    with tempfile.TemporaryDirectory(prefix="chatbot-bench-") as index_path:
+        return run_in(params, index_path)
+
+
+def run_in(params: Dict[str, Any], index_path: str) -> Dict[str, Any]:
+    configure(params, index_path)
+    build_corpus(index_path, params["corpus_size"], params["seed"])
+
+    from chatbot.resources import get_graph, get_stage_evaluator
+    from chatbot.tracing import metrics
+    from schema.registry import CaseRegistry
+
+    case = CaseRegistry().get(params["case"])
+    if case is None:
+        raise SystemExit(f"Case {params['case']} not found in data/cases")
+    graph = get_graph()
+    get_stage_evaluator(case.caseNum, case.version, case)
+    metrics.reset()
+
+    results: List[Dict[str, Any]] = []
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=params["sessions"], thread_name_prefix="session") as pool:
+        futures = [pool.submit(run_session, idx, params, case, results) for idx in range(params["sessions"])]
+        for future in futures:
+            future.result()
+    wall = time.perf_counter() - started
+    rss_after = rss_bytes()
+
+    latencies = [result["latency"] for result in results]
+    ttfts = [result["ttft"] for result in results if result["ttft"] is not None]
+    report = {
+        "params": params,
+        "python": platform.python_version(),
+        "turns": len(results),
+        "wall_seconds": wall,
+        "turns_per_second": len(results) / wall if wall else 0.0,
+        "turn_p50": percentile(latencies, 0.5),
+        "turn_p95": percentile(latencies, 0.95),
+        "turn_p99": percentile(latencies, 0.99),
+        "ttft_p50": percentile(ttfts, 0.5),
+        "ttft_p95": percentile(ttfts, 0.95),
+        "ttft_p99": percentile(ttfts, 0.99),
+        "memory_per_session_bytes": max(rss_after - rss_before, 0) / params["sessions"],
+        "nodes": {row["name"]: {"p50": row["p50"], "p95": row["p95"], "count": row["count"]}
+                  for row in metrics.snapshot()["histograms"]
+                  if row["metric"] == "chatbot_span_seconds" and row.get("kind") in ("node", "tool")},
+    }
+    checkpointer = graph.checkpointer
+    if hasattr(checkpointer, "stats"):
+        report["checkpoint_bytes_per_session"] = checkpointer.stats()["bytes"] / params["sessions"]
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Metrics that got worse than the baseline by more than `tolerance` (a fraction)."""
+    regressions = []
+    for key in LOWER_IS_BETTER:
+        if baseline.get(key) and report[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key}: {report[key]:.4f} vs baseline {baseline[key]:.4f}")
+    for key in HIGHER_IS_BETTER:
+        if baseline.get(key) and report[key] < baseline[key] * (1 - tolerance):
+            regressions.append(f"{key}: {report[key]:.2f} vs baseline {baseline[key]:.2f}")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{report['params']['sessions']} sessions, {report['turns']} turns in {report['wall_seconds']:.2f}s "
+          f"({report['turns_per_second']:.1f} turns/s)")
+    print(f"turn latency  p50 {report['turn_p50']:.3f}s  p95 {report['turn_p95']:.3f}s  p99 {report['turn_p99']:.3f}s")
+    print(f"TTFT          p50 {report['ttft_p50']:.3f}s  p95 {report['ttft_p95']:.3f}s  p99 {report['ttft_p99']:.3f}s")
+    print(f"memory        {report['memory_per_session_bytes'] / 1024:.0f} KiB RSS per session"
+          + (f", {report['checkpoint_bytes_per_session'] / 1024:.0f} KiB checkpoints per session"
+             if "checkpoint_bytes_per_session" in report else ""))
+    for name, row in sorted(report["nodes"].items()):
+        print(f"  {name:<20} p50 {row['p50']:.3f}s  p95 {row['p95']:.3f}s  ({row['count']} calls)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline load test of the chat graph against local stand-ins.")
+    parser.add_argument("--sessions", type=int, help="Concurrent simulated students")
+    parser.add_argument("--case", type=int, help="Case number to work through")
+    parser.add_argument("--questions-per-stage", type=int, help="Free-text questions asked before each submission")
+    parser.add_argument("--think-time", type=float, help="Mean seconds between a student's turns")
+    parser.add_argument("--model-latency", type=float, help="Median seconds to first token of the fake model")
+    parser.add_argument("--model-jitter", type=float, help="Lognormal sigma of the fake model's latency")
+    parser.add_argument("--tokens-per-second", type=float, help="Fake model streaming rate (0 for no delay)")
+    parser.add_argument("--answer-words", type=int, help="Length of the fake model's answers")
+    parser.add_argument("--failure-rate", type=float, help="Share of primary model calls that fail")
+    parser.add_argument("--corpus-size", type=int, help="Chunks in the in-memory vector index")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the report to PATH")
+    parser.add_argument("--baseline", metavar="PATH", help="Rerun with PATH's parameters and compare against it")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression as a fraction (default 0.2)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    baseline = None
+    params = dict(DEFAULTS)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        params.update(baseline["params"])
+    for key in DEFAULTS:
+        value = getattr(args, key)
+        if value is not None:
+            params[key] = value
+
+    report = run(params)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
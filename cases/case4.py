@@ -1,6 +0,0 @@
-import yaml
-import streamlit as st
-from components.casePage import CasePage
-from schema.schema import Case
-
-st.write('Under construction :(')
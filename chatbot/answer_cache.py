@@ -0,0 +1,158 @@
+# Cache of finished answers to free-text questions, opt-in with ANSWER_CACHE=true.
+# Students in a cohort ask the same few questions, so an answer generated for one of them is
+# replayed to the next student who asks the same thing at the same case and stage. Questions
+# match on their normalised text first, then by embedding similarity within the (case, stage)
+# bucket. The cache empties itself when the system prompt or the vector index changes. Only
+# answers that cannot depend on the student's own conversation are stored: the question must be the
+# first one asked since the current stage started, and the answer must be grounded in the guides.
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .retrieval_cache import normalise_query
+from .tracing import metrics
+from .vectors import unit_vectors
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer():
+    question: str
+    answer: str
+    sources: List[dict] = field(default_factory=list)
+    stored_at: float = field(default_factory=time.monotonic)
+    hits: int = 0
+
+
+class AnswerCache():
+    """Answers keyed by case number, stage and question meaning.
+
+    Args:
+        max_entries: Answers kept across all cases; the least recently used are evicted.
+        ttl: Seconds an answer is served before it has to be generated again.
+        similarity_threshold: Minimum cosine similarity between question embeddings for a match.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 24 * 3600.0, similarity_threshold: float = 0.92):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.version = ""
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        # (case, stage, normalised question) -> (unit embedding or None, answer)
+        self._entries: "OrderedDict[Tuple[int, int, str], Tuple[Optional[np.ndarray], CachedAnswer]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def check_version(self, version: str) -> None:
+        """Drop every answer when `version` (e.g. a hash of the system prompt) has changed."""
+        with self._lock:
+            if version == self.version:
+                return
+            stale = bool(self.version)
+            self.version = version
+        if stale:
+            self.invalidate()
+
+    def _expired(self, answer: CachedAnswer) -> bool:
+        return time.monotonic() - answer.stored_at > self.ttl
+
+    def _hit(self, key: Tuple[int, int, str], kind: str) -> CachedAnswer:
+        self._entries.move_to_end(key)
+        answer = self._entries[key][1]
+        answer.hits += 1
+        metrics.increment("chatbot_answer_cache_total", result=kind)
+        return answer
+
+    def get_exact(self, case_num: int, stage: int, question: str) -> Optional[CachedAnswer]:
+        key = (case_num, stage, normalise_query(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1]):
+                return None
+            self.hits_exact += 1
+            return self._hit(key, "exact")
+
+    def get_similar(self, case_num: int, stage: int, embedding: List[float]) -> Optional[CachedAnswer]:
+        """Closest answer in the (case, stage) bucket, or None (counted as a miss)."""
+        query = unit_vectors(embedding)
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            for key, (cached, answer) in self._entries.items():
+                if key[:2] != (case_num, stage) or cached is None or self._expired(answer):
+                    continue
+                score = float(cached @ query)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                metrics.increment("chatbot_answer_cache_total", result="miss")
+                return None
+            self.hits_semantic += 1
+            return self._hit(best_key, "similar")
+
+    def put(self, case_num: int, stage: int, question: str, embedding: Optional[List[float]], answer: str,
+            sources: Optional[List[dict]] = None) -> None:
+        key = (case_num, stage, normalise_query(question))
+        entry = (None if embedding is None else unit_vectors(embedding), CachedAnswer(question, answer, sources or []))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        logger.info("Answer cache invalidated")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits_exact + self.hits_semantic + self.misses
+        return {
+            "entries": len(self),
+            "hits_exact": self.hits_exact,
+            "hits_semantic": self.hits_semantic,
+            "misses": self.misses,
+            "hit_rate": (self.hits_exact + self.hits_semantic) / lookups if lookups else 0.0,
+        }
+
+
+def shareable_sources(messages: List[Any]) -> Optional[List[dict]]:
+    """Sources of the latest turn if its answer is safe to replay to other students, else None.
+
+    The latest human message must be the only free-text question since the last stage submission
+    (or the start of the thread), and the turn must have retrieved at least one guide chunk.
+    """
+    sources, questions = [], 0
+    for message in reversed(messages):
+        if message.type == "human":
+            if message.additional_kwargs.get("stage") is not None:
+                break
+            questions += 1
+            if questions > 1:
+                return None
+        elif message.type == "tool" and questions == 0 and message.artifact:
+            sources.extend(doc.metadata for doc in message.artifact)
+    return sources[::-1] if questions == 1 and sources else None
+
+
+def prompt_version(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def replay(answer: str, chunk_chars: int = 64) -> Iterator[str]:
+    """Yield a cached answer in pieces so it renders like a streamed one."""
+    for start in range(0, len(answer), chunk_chars):
+        yield answer[start:start + chunk_chars]
+
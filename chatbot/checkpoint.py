@@ -0,0 +1,244 @@
+# Bounded checkpointers for the chat graph.
+# LangGraph writes a checkpoint for every step of every turn, and MemorySaver keeps all of them
+# forever. Only the latest checkpoint of a thread is needed to continue a conversation, so both
+# backends here keep the newest `max_checkpoints` per thread and evict idle threads. `on_evict` is
+# called with each evicted thread ID so the ThreadRegistry stops treating it as live.
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple
+from langgraph.checkpoint.memory import MemorySaver
+
+from .settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedMemorySaver(MemorySaver):
+    """In-memory checkpointer with a per-thread checkpoint cap and LRU/TTL eviction of idle threads.
+
+    Args:
+        max_checkpoints: Checkpoints kept per thread; older ones and their pending writes are dropped.
+        max_threads: Threads kept in memory; the least recently used thread is evicted beyond this.
+        idle_ttl: Seconds after which an untouched thread is evicted.
+        on_evict: Called with each evicted thread ID, outside the lock.
+    """
+
+    def __init__(self, max_checkpoints: int = 10, max_threads: int = 500, idle_ttl: float = 3600.0, **kwargs):
+        super().__init__(**kwargs)
+        self.max_checkpoints = max_checkpoints
+        self.max_threads = max_threads
+        self.idle_ttl = idle_ttl
+        self.evicted_threads = 0
+        self.pruned_checkpoints = 0
+        self.on_evict: Optional[Callable[[str], None]] = None
+        self._last_active: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _touch(self, thread_id: str) -> None:
+        self._last_active[thread_id] = time.monotonic()
+        self._last_active.move_to_end(thread_id)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        excess = len(checkpoints) - self.max_checkpoints
+        if excess <= 0:
+            return
+        # Checkpoint IDs are time-ordered UUIDs, so sorting puts the oldest first
+        for checkpoint_id in sorted(checkpoints)[:excess]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        self.pruned_checkpoints += excess
+
+    def _evict(self) -> List[str]:
+        cutoff = time.monotonic() - self.idle_ttl
+        evicted = []
+        while self._last_active:
+            thread_id, last_active = next(iter(self._last_active.items()))
+            if len(self._last_active) <= self.max_threads and last_active >= cutoff:
+                break
+            self.delete_thread(thread_id)
+            self.evicted_threads += 1
+            evicted.append(thread_id)
+        return evicted
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._last_active.pop(thread_id, None)
+            self.storage.pop(thread_id, None)
+            for key in [key for key in self.writes if key[0] == thread_id]:
+                del self.writes[key]
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            if thread_id in self._last_active:
+                self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs) -> Iterator[CheckpointTuple]:
+        # Materialise under the lock so eviction can't mutate storage mid-iteration
+        with self._lock:
+            checkpoints = list(super().list(config, **kwargs))
+        yield from checkpoints
+
+    def put(self, config: RunnableConfig, checkpoint, metadata, new_versions) -> RunnableConfig:
+        with self._lock:
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            self._touch(thread_id)
+            self._prune(thread_id, config["configurable"]["checkpoint_ns"])
+            evicted = self._evict()
+        notify_evicted(self.on_evict, evicted)
+        return saved
+
+    def put_writes(self, config: RunnableConfig, writes, task_id: str) -> None:
+        with self._lock:
+            super().put_writes(config, writes, task_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Thread/checkpoint counts, approximate serialized size and eviction counters."""
+        with self._lock:
+            checkpoints = 0
+            size = 0
+            for namespaces in self.storage.values():
+                for checkpoints_ in namespaces.values():
+                    checkpoints += len(checkpoints_)
+                    for (_, checkpoint), (_, metadata), _ in checkpoints_.values():
+                        size += len(checkpoint) + len(metadata)
+            for writes in self.writes.values():
+                for write in writes.values():
+                    size += len(write[2][1])
+            return {
+                "backend": "memory",
+                "threads": len(self.storage),
+                "checkpoints": checkpoints,
+                "bytes": size,
+                "evicted_threads": self.evicted_threads,
+                "pruned_checkpoints": self.pruned_checkpoints,
+            }
+
+
+def notify_evicted(on_evict: Optional[Callable[[str], None]], thread_ids: List[str]) -> None:
+    if on_evict is None:
+        return
+    for thread_id in thread_ids:
+        try:
+            on_evict(thread_id)
+        except Exception as e:
+            logger.error(f"Eviction callback failed for thread {thread_id}: {e}")
+
+
+def build_sqlite_saver(path: str, max_checkpoints: int = 10, max_threads: int = 5000,
+                       idle_ttl: float = 7 * 24 * 3600.0) -> BaseCheckpointSaver:
+    """On-disk checkpointer so conversations survive a restart. Needs `langgraph-checkpoint-sqlite`."""
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError as e:
+        raise ImportError("CHECKPOINT_BACKEND=sqlite requires `pip install langgraph-checkpoint-sqlite`") from e
+
+    class BoundedSqliteSaver(SqliteSaver):
+        def __init__(self, conn: sqlite3.Connection):
+            super().__init__(conn)
+            self.max_checkpoints = max_checkpoints
+            self.max_threads = max_threads
+            self.idle_ttl = idle_ttl
+            self.evicted_threads = 0
+            self.pruned_checkpoints = 0
+            self.on_evict: Optional[Callable[[str], None]] = None
+
+        def setup(self) -> None:
+            if self.is_setup:
+                return
+            super().setup()
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, last_active REAL NOT NULL)")
+            self.conn.commit()
+
+        def delete_thread(self, thread_id: str) -> None:
+            with self.cursor() as cur:
+                self._delete_thread(cur, thread_id)
+
+        def _delete_thread(self, cur: sqlite3.Cursor, thread_id: str) -> None:
+            for table in ("checkpoints", "writes", "thread_activity"):
+                cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+        def put(self, config: RunnableConfig, checkpoint, metadata, new_versions) -> RunnableConfig:
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = str(config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"]["checkpoint_ns"]
+            with self.cursor() as cur:
+                cur.execute("INSERT OR REPLACE INTO thread_activity (thread_id, last_active) VALUES (?, ?)",
+                            (thread_id, time.time()))
+                stale = cur.execute(
+                    "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+                    (thread_id, checkpoint_ns, self.max_checkpoints)).fetchall()
+                for (checkpoint_id,) in stale:
+                    for table in ("checkpoints", "writes"):
+                        cur.execute(f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                                    (thread_id, checkpoint_ns, checkpoint_id))
+                self.pruned_checkpoints += len(stale)
+                evict = cur.execute(
+                    "SELECT thread_id FROM thread_activity WHERE last_active < ? "
+                    "UNION SELECT thread_id FROM (SELECT thread_id FROM thread_activity "
+                    "ORDER BY last_active DESC LIMIT -1 OFFSET ?)",
+                    (time.time() - self.idle_ttl, self.max_threads)).fetchall()
+                for (evicted,) in evict:
+                    self._delete_thread(cur, evicted)
+                self.evicted_threads += len(evict)
+            notify_evicted(self.on_evict, [evicted for (evicted,) in evict])
+            return saved
+
+        # SqliteSaver is sync-only; run it in a worker thread so graph.astream can use it too
+        async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config: Optional[RunnableConfig], **kwargs) -> AsyncIterator[CheckpointTuple]:
+            for checkpoint in await asyncio.to_thread(lambda: list(self.list(config, **kwargs))):
+                yield checkpoint
+
+        async def aput(self, config: RunnableConfig, checkpoint, metadata, new_versions) -> RunnableConfig:
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config: RunnableConfig, writes, task_id: str) -> None:
+            await asyncio.to_thread(self.put_writes, config, writes, task_id)
+
+        def stats(self) -> Dict[str, Any]:
+            with self.cursor(transaction=False) as cur:
+                threads = cur.execute("SELECT COUNT(DISTINCT thread_id) FROM checkpoints").fetchone()[0]
+                checkpoints = cur.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+                page_count = cur.execute("PRAGMA page_count").fetchone()[0]
+                page_size = cur.execute("PRAGMA page_size").fetchone()[0]
+            return {
+                "backend": "sqlite",
+                "threads": threads,
+                "checkpoints": checkpoints,
+                "bytes": page_count * page_size,
+                "evicted_threads": self.evicted_threads,
+                "pruned_checkpoints": self.pruned_checkpoints,
+            }
+
+    return BoundedSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+
+def build_checkpointer() -> BaseCheckpointSaver:
+    """Checkpointer chosen by the CHECKPOINT_* settings ("memory" by default, or "sqlite")."""
+    backend = get_setting("CHECKPOINT_BACKEND", "memory")
+    max_checkpoints = get_setting("CHECKPOINT_MAX_PER_THREAD", 10)
+    if backend == "sqlite":
+        return build_sqlite_saver(get_setting("CHECKPOINT_DB_PATH", "./data/checkpoints.sqlite"),
+                                  max_checkpoints=max_checkpoints,
+                                  max_threads=get_setting("CHECKPOINT_MAX_THREADS", 5000),
+                                  idle_ttl=get_setting("CHECKPOINT_IDLE_TTL", 7 * 24 * 3600.0))
+    if backend != "memory":
+        raise ValueError(f"Unknown CHECKPOINT_BACKEND: {backend}")
+    return BoundedMemorySaver(max_checkpoints=max_checkpoints,
+                              max_threads=get_setting("CHECKPOINT_MAX_THREADS", 500),
+                              idle_ttl=get_setting("CHECKPOINT_IDLE_TTL", 3600.0))
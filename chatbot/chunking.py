@@ -0,0 +1,21 @@
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter, MarkdownTextSplitter
+
+CHUNK_SIZE = 1024
+CHUNK_OVERLAP = 200
+
+md_splitter = MarkdownTextSplitter()
+char_splitter = CharacterTextSplitter(
+    separator="\n\n",
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+    length_function=len,
+    is_separator_regex=False,
+)
+
+
+def split_documents(docs: List[Document]) -> List[Document]:
+    """Split guides the same way the index was built: markdown sections, then 1024-char chunks."""
+    return char_splitter.split_documents(md_splitter.split_documents(docs))
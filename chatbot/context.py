@@ -0,0 +1,116 @@
+# Token-budgeted conversation windowing for the chat graph.
+# `manage_context` runs before every turn. Once the history goes over CONTEXT_TOKEN_BUDGET it
+# drops whole turns, oldest first, until the history is back under CONTEXT_TRIM_TARGET of the
+# budget. Dropped turns are folded into a running summary kept in the graph state, so each turn
+# is summarised exactly once. System messages and the current stage's submission/evaluation are
+# never dropped.
+import logging
+from typing import List, Optional
+
+from langchain_core.messages import AnyMessage, HumanMessage, RemoveMessage, SystemMessage
+from langgraph.constants import TAG_NOSTREAM
+from langgraph.graph import MessagesState
+
+from .resources import get_chat_model
+from .settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "You are summarising an earlier part of a tutoring conversation between a medical student and "
+    "Dr. XRLiA, a radiology tutor. Update the running summary with the new messages below. Keep the "
+    "student's answers, mistakes, the feedback given and any open questions. Be concise."
+)
+
+
+class ChatState(MessagesState):
+    # Running summary of turns that were dropped from `messages`
+    summary: str
+    # Vector hits found while routing this turn's question, reused by `retrieve` (see chatbot.router)
+    route_hits: Optional[dict]
+
+
+def stage_message(prompt: str, stage: int) -> HumanMessage:
+    """A human message tagged with the case stage it submits answers for."""
+    return HumanMessage(prompt, additional_kwargs={"stage": stage})
+
+
+def count_tokens(messages: List[AnyMessage]) -> int:
+    """Cheap token estimate (characters / CONTEXT_CHARS_PER_TOKEN plus per-message overhead)."""
+    chars_per_token = get_setting("CONTEXT_CHARS_PER_TOKEN", 4.0)
+    return sum(int(len(str(message.content)) / chars_per_token) + 4 for message in messages)
+
+
+def split_turns(messages: List[AnyMessage]):
+    """Split history into system messages and turns; a turn starts at each human message."""
+    system, turns = [], []
+    for message in messages:
+        if message.type == "system":
+            system.append(message)
+        elif message.type == "human" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return system, turns
+
+
+def current_stage_turn(turns: List[List[AnyMessage]]) -> Optional[int]:
+    """Index of the most recent stage submission turn, if any."""
+    for idx in range(len(turns) - 1, -1, -1):
+        if turns[idx][0].additional_kwargs.get("stage") is not None:
+            return idx
+    return None
+
+
+def summarise(summary: str, messages: List[AnyMessage]) -> str:
+    transcript = "\n".join(
+        f"{message.type}: {message.content}" for message in messages
+        if message.type in ("human", "ai") and message.content
+    )
+    if not transcript:
+        return summary
+    prompt = f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"
+    response = get_chat_model().invoke([SystemMessage(SUMMARY_PROMPT), HumanMessage(prompt)],
+                                       config={"tags": [TAG_NOSTREAM]})
+    return response.content
+
+
+def manage_context(state: ChatState):
+    """Trim or summarise older turns so the prompt stays under the token budget."""
+    budget = get_setting("CONTEXT_TOKEN_BUDGET", 6000)
+    summary = state.get("summary", "")
+    messages = state["messages"]
+    if count_tokens(messages) + len(summary) // 4 <= budget:
+        return None
+
+    _, turns = split_turns(messages)
+    protected = {len(turns) - 1, current_stage_turn(turns)}
+    target = budget * get_setting("CONTEXT_TRIM_TARGET", 0.7)
+    total = count_tokens(messages)
+    dropped = []
+    for idx, turn in enumerate(turns):
+        if total <= target:
+            break
+        if idx in protected:
+            continue
+        dropped.extend(turn)
+        total -= count_tokens(turn)
+    if not dropped:
+        return None
+
+    update = {"messages": [RemoveMessage(id=message.id) for message in dropped]}
+    if get_setting("CONTEXT_STRATEGY", "summarize") == "summarize":
+        update["summary"] = summarise(summary, dropped)
+    logger.info(f"Dropped {len(dropped)} messages from context ({total} tokens left)")
+    return update
+
+
+def with_summary(state: ChatState, messages: List[AnyMessage]) -> List[AnyMessage]:
+    """Insert the running summary after the leading system messages."""
+    summary = state.get("summary")
+    if not summary:
+        return messages
+    idx = 0
+    while idx < len(messages) and messages[idx].type == "system":
+        idx += 1
+    return messages[:idx] + [SystemMessage(f"Summary of the earlier conversation:\n{summary}")] + messages[idx:]
@@ -1,14 +1,130 @@
 import time
+import random
 import logging
-from typing import List
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import httpx
 from langchain_mistralai import MistralAIEmbeddings
+from pydantic import PrivateAttr
+
+from .ratelimit import TokenBucket
+from .tracing import record_rate_limit_wait, span
 logger = logging.getLogger(__name__)
 
 
+class EmbeddingBatchError(Exception):
+    """Raised when some batches still fail after retrying.
+
+    `completed` maps each successful batch's start offset to its vectors and `failed` maps each
+    failed batch's start offset to its texts, so callers can retry just the failed ones.
+    """
+
+    def __init__(self, completed: Dict[int, List[List[float]]], failed: Dict[int, List[str]], cause: Exception):
+        super().__init__(f"{len(failed)} embedding batch(es) failed: {cause}")
+        self.completed = completed
+        self.failed = failed
+        self.cause = cause
+
+
 class MistralAIEmbeddingsWithPause(MistralAIEmbeddings):
-    def __init__(self, api_key: str):
-        super().__init__(api_key=api_key)
+    """Mistral embeddings with a concurrent, rate-limited batch pipeline.
+
+    Up to `max_concurrency` batches are in flight at once. Each request first takes a token from a
+    shared token bucket (`requests_per_second`, `burst`). A 429 pauses the bucket for the Retry-After
+    period, and each batch is retried on its own with exponential backoff, so a failure never
+    throws away batches that already succeeded.
+    """
+    max_concurrency: int = 4
+    requests_per_second: float = 1.0
+    burst: int = 2
+    max_attempts: int = 5
+    backoff: float = 1.0
+    _limiter: TokenBucket = PrivateAttr()
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(api_key=api_key, **kwargs)
+        self._limiter = TokenBucket(rate=self.requests_per_second, capacity=self.burst)
+
+    def _retry_delay(self, response: Optional[httpx.Response], attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                try:
+                    return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+                except (TypeError, ValueError):
+                    pass
+        return self.backoff * 2 ** attempt * (0.5 + random.random())
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_attempts):
+            record_rate_limit_wait("embedding", self._limiter.acquire())
+            response = None
+            try:
+                with span("embedding", "request", texts=len(batch), attempt=attempt) as attributes:
+                    response = self.client.post(url="/embeddings", json=dict(model=self.model, input=batch))
+                    attributes["status"] = response.status_code
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request,
+                                                response=response)
+                response.raise_for_status()
+                return [list(map(float, embedding_obj["embedding"])) for embedding_obj in response.json()["data"]]
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                status = response.status_code if response is not None else None
+                if status is not None and status < 500 and status != 429:
+                    raise
+                if attempt == self.max_attempts - 1:
+                    raise
+                delay = self._retry_delay(response, attempt)
+                if status == 429:
+                    self._limiter.pause(delay)
+                logger.warning(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    def iter_embed_batches(self, texts: List[str]) -> Iterator[Tuple[int, List[List[float]]]]:
+        """Embed `texts`, yielding `(offset, vectors)` for each batch as soon as it completes.
+
+        Batches complete out of order; `offset` is the index in `texts` of the batch's first text.
+        Raises EmbeddingBatchError after all other batches have finished if any batch failed.
+        """
+        batches = []
+        offset = 0
+        for batch in self._get_batches(texts):
+            batches.append((offset, batch))
+            offset += len(batch)
+        completed: Dict[int, List[List[float]]] = {}
+        failed: Dict[int, List[str]] = {}
+        cause = None
+        pending = {}
+        queue = iter(batches)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed") as pool:
+            # Keep at most max_concurrency batches in flight so results stream back with backpressure
+            for offset, batch in queue:
+                pending[pool.submit(self._embed_batch, batch)] = (offset, batch)
+                if len(pending) >= self.max_concurrency:
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    offset, batch = pending.pop(future)
+                    try:
+                        vectors = future.result()
+                    except Exception as e:
+                        logger.error(f"An error occurred with MistralAI: {e}")
+                        failed[offset] = batch
+                        cause = e
+                    else:
+                        completed[offset] = vectors
+                        yield offset, vectors
+                    next_batch = next(queue, None)
+                    if next_batch is not None:
+                        pending[pool.submit(self._embed_batch, next_batch[1])] = next_batch
+        if failed:
+            raise EmbeddingBatchError(completed, failed, cause)
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Embed a list of document texts.
@@ -19,25 +135,7 @@ class MistralAIEmbeddingsWithPause(MistralAIEmbeddings):
         Returns:
             List of embeddings, one for each text.
         """
-        try:
-            batch_responses = []
-            for batch in self._get_batches(texts):
-                batch_responses.append(
-                    self.client.post(
-                        url="/embeddings",
-                        json=dict(
-                            model=self.model,
-                            input=batch,
-                        ),
-                    )
-                )
-                time.sleep(1.6)
-            batch_responses = tuple(batch_responses)
-            return [
-                list(map(float, embedding_obj["embedding"]))
-                for response in batch_responses
-                for embedding_obj in response.json()["data"]
-            ]
-        except Exception as e:
-            logger.error(f"An error occurred with MistralAI: {e}")
-            raise
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        for offset, vectors in self.iter_embed_batches(texts):
+            embeddings[offset:offset + len(vectors)] = vectors
+        return embeddings
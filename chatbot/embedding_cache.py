@@ -0,0 +1,137 @@
+# Persistent embedding cache shared by query and document embedding.
+# Vectors are stored as float32 blobs in SQLite, keyed by a hash of the model name and the text,
+# and the least recently used rows are evicted once the table holds more than `max_entries`.
+# Lookups only read: the row count is kept in memory (counted once at startup, so it is approximate
+# when several processes share the file), and last-used times are buffered and written in batches.
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# SQLite's default limit on bound parameters per statement
+_MAX_PARAMS = 900
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings model so texts already embedded by the same model skip the network."""
+
+    def __init__(self, inner: Embeddings, path: str, max_entries: int = 100_000, touch_batch: int = 256,
+                 touch_interval: float = 30.0):
+        self.inner = inner
+        self.model = getattr(inner, "model", type(inner).__name__)
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._touched: Dict[str, float] = {}  # key -> last used, not yet written
+        self._flushedAt = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+            """
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _MAX_PARAMS):
+                batch = keys[start:start + _MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                    self._touched[key] = now
+            if len(self._touched) >= self.touch_batch or time.monotonic() - self._flushedAt >= self.touch_interval:
+                self._flush_touched()
+                self._conn.commit()
+        return found
+
+    def _flush_touched(self) -> None:
+        # Caller holds the lock and commits
+        if self._touched:
+            self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                   [(last_used, key) for key, last_used in self._touched.items()])
+            self._touched.clear()
+        self._flushedAt = time.monotonic()
+
+    def _store(self, items: Dict[str, List[float]]) -> None:
+        now = time.time()
+        with self._lock:
+            # The same model and text always give the same vector, so a row added meanwhile is kept as is
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()])
+            self._count += max(cursor.rowcount, 0)
+            if self._count > self.max_entries:
+                # Evict a tenth extra so the next few stores don't each pay for a DELETE
+                self._flush_touched()
+                excess = self._count - self.max_entries + self.max_entries // 10
+                cursor = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)", (excess,))
+                self._count -= max(cursor.rowcount, 0)
+            self._conn.commit()
+
+    def flush(self) -> None:
+        """Write buffered last-used times now, e.g. before shutting down."""
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(keys)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            vectors = self.inner.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        found = self._lookup([key])
+        if key in found:
+            self.hits += 1
+            return found[key]
+        self.misses += 1
+        vector = self.inner.embed_query(text)
+        self._store({key: vector})
+        return vector
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,117 @@
+# Fast path for grading stage submissions.
+# Reference-answer embeddings and key terms are computed once per case. A submission is scored
+# with one batched embedding call, and the scores go into a free-text evaluation prompt that the
+# graph answers with a single streamed model call (the `evaluate_stage` node, no tools or
+# retrieval). A similarity that could not be computed is reported as unavailable, never as 0.
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .lexical_index import content_words
+from .vectors import unit_vectors
+
+logger = logging.getLogger(__name__)
+
+# Words of the reference answers that say nothing about the answer, on top of the BM25 stopwords
+ANSWER_FILLER = frozenset("""
+correct definition despite ensuing first followed helpful hence markedly potentially result since
+times varies very
+""".split())
+
+
+def key_terms(text: str) -> List[str]:
+    """Content words of a reference answer, in order and without duplicates, split as for BM25."""
+    terms = []
+    for word in content_words(text):
+        if (len(word) > 2 or word.isdigit()) and word not in ANSWER_FILLER and word not in terms:
+            terms.append(word)
+    return terms
+
+
+def _mentions(term: str, answer_words: set) -> bool:
+    # Loose stem match so "inflated" matches "inflation" and "tubes" matches "tube"
+    stem = term[:5]
+    return any(word == term or (len(stem) >= 4 and word.startswith(stem)) for word in answer_words)
+
+
+@dataclass(frozen=True)
+class AnswerScore():
+    similarity: Optional[float]  # None when no embedding comparison was possible
+    matched_terms: List[str]
+    missing_terms: List[str]
+
+    @property
+    def term_coverage(self) -> float:
+        total = len(self.matched_terms) + len(self.missing_terms)
+        return len(self.matched_terms) / total if total else 1.0
+
+
+class StageEvaluator():
+    """Precomputed grading material for one case.
+
+    Args:
+        case: The case whose stage questions are graded.
+        embeddings: Embedding model; reference answers are embedded once, here.
+    """
+
+    def __init__(self, case, embeddings: Optional[Embeddings]):
+        self.case = case
+        self.embeddings = embeddings
+        self.questions = case.questions
+        self.terms = {stage: [key_terms(item.answer) for item in items] for stage, items in self.questions.items()}
+        self.references: Dict[str, np.ndarray] = {}
+        if embeddings is not None:
+            stages = list(self.questions)
+            answers = [item.answer for stage in stages for item in self.questions[stage]]
+            try:
+                vectors = unit_vectors(embeddings.embed_documents(answers))
+            except Exception as e:
+                logger.error(f"Could not embed reference answers for case {case.caseNum}: {e}")
+            else:
+                offset = 0
+                for stage in stages:
+                    count = len(self.questions[stage])
+                    self.references[stage] = vectors[offset:offset + count]
+                    offset += count
+
+    def score(self, stage: int, answers: List[str]) -> List[AnswerScore]:
+        """Score all answers of a stage with a single embedding call."""
+        stage_key = f"stage{stage}"
+        similarities: List[Optional[float]] = [None] * len(answers)
+        answered = [idx for idx, answer in enumerate(answers) if answer.strip()]
+        if answered and stage_key in self.references:
+            try:
+                vectors = unit_vectors(self.embeddings.embed_documents([answers[idx] for idx in answered]))
+                for idx, vector in zip(answered, vectors):
+                    similarities[idx] = float(self.references[stage_key][idx] @ vector)
+            except Exception as e:
+                logger.error(f"Could not embed answers for case {self.case.caseNum} stage {stage}: {e}")
+        scores = []
+        for idx, answer in enumerate(answers):
+            words = set(content_words(answer))
+            terms = self.terms[stage_key][idx]
+            matched = [term for term in terms if _mentions(term, words)]
+            scores.append(AnswerScore(similarities[idx], matched, [term for term in terms if term not in matched]))
+        return scores
+
+    def build_submission(self, stage: int, answers: List[str]) -> str:
+        """Evaluation request for the `evaluate_stage` node, grounded in this case's background."""
+        scores = self.score(stage, answers)
+        prompt = (f"Stage {stage} submission for case {self.case.caseNum}.\n\n"
+                  f"CASE BACKGROUND:\n{self.case.caseDesc}\n\n")
+        for idx, (item, answer, score) in enumerate(zip(self.questions[f"stage{stage}"], answers, scores)):
+            similarity = "unavailable" if score.similarity is None else f"{score.similarity:.2f}"
+            prompt += (f"Question {idx + 1}: {item.question}\n"
+                       f"Correct answer: {item.answer}\n"
+                       f"User answer: {answer or '(no answer)'}\n"
+                       f"Automatic check: semantic similarity {similarity}, "
+                       f"key terms covered {len(score.matched_terms)}/{len(score.matched_terms) + len(score.missing_terms)}"
+                       f"{', missing: ' + ', '.join(score.missing_terms[:8]) if score.missing_terms else ''}\n\n")
+        prompt += ("Evaluate the above questions as instructed in system message, using the case background. "
+                   "The automatic check is only a hint; judge whether each answer is factually congruent "
+                   "with the correct answer.")
+        return prompt
+
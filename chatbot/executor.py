@@ -0,0 +1,164 @@
+# Shared async execution of graph turns.
+# Every session's turn runs as `graph.astream(...)` on one process-wide event loop instead of
+# blocking in the session's own script thread. Turns wait in per-session queues and are started
+# round-robin across sessions, at most `max_concurrency` at a time, so one busy session can't
+# starve the others. New turns are rejected up front with QueueFullError when the queue is full.
+# Queue depth and running turns are exported as the chatbot_executor_turns gauge.
+import time
+import queue
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from .tracing import metrics, trace_turn, traced_config
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class QueueFullError(Exception):
+    """Raised when a turn is not admitted because the executor (or the session) is at capacity."""
+
+
+@dataclass
+class _Job():
+    session_id: str
+    graph: Any
+    input: Any
+    config: dict
+    stream_mode: str
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    output: "queue.Queue" = field(default_factory=queue.Queue)
+    task: Optional[asyncio.Task] = None
+    cancelled: bool = False
+
+
+class GraphExecutor():
+    """Runs graph turns on a background event loop with fair per-session scheduling.
+
+    Args:
+        max_concurrency: Turns executing at the same time across all sessions.
+        max_queue: Turns allowed to wait; further submissions raise QueueFullError.
+        max_per_session: Turns one session may have queued or running at once.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 64, max_per_session: int = 2):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_per_session = max_per_session
+        self.admitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._queues: "OrderedDict[str, Deque[_Job]]" = OrderedDict()
+        self._active: Dict[str, int] = {}
+        self._queued = 0
+        self._running = 0
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="graph-executor", daemon=True)
+        self._thread.start()
+
+    def stream(self, session_id: str, graph, input: Any, config: dict, stream_mode: str = "messages") -> Iterator:
+        """Queue a turn and yield its stream chunks in the calling thread as they are produced."""
+        job = _Job(session_id, graph, input, config, stream_mode)
+        with self._lock:
+            if self._queued >= self.max_queue or self._active.get(session_id, 0) >= self.max_per_session:
+                self.rejected += 1
+                raise QueueFullError(f"Executor at capacity ({self._queued} queued, {self._running} running)")
+            self._queues.setdefault(session_id, deque()).append(job)
+            self._active[session_id] = self._active.get(session_id, 0) + 1
+            self._queued += 1
+            self.admitted += 1
+            self._publish()
+        self._loop.call_soon_threadsafe(self._dispatch)
+        return self._drain(job)
+
+    def _drain(self, job: _Job) -> Iterator:
+        try:
+            while True:
+                item = job.output.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Caller stopped reading (e.g. the script rerun); stop the turn as well
+            job.cancelled = True
+            if job.task is not None and not job.task.done():
+                self._loop.call_soon_threadsafe(job.task.cancel)
+
+    def _dispatch(self) -> None:
+        """Start queued turns round-robin across sessions while there are free slots. Runs on the loop."""
+        with self._lock:
+            while self._running < self.max_concurrency and self._queues:
+                session_id, jobs = next(iter(self._queues.items()))
+                job = jobs.popleft()
+                # Move the session to the back so the next slot goes to a different session
+                del self._queues[session_id]
+                if jobs:
+                    self._queues[session_id] = jobs
+                self._queued -= 1
+                if job.cancelled:
+                    self._release(job)
+                    continue
+                self._running += 1
+                wait = time.perf_counter() - job.enqueued_at
+                self._waits.append(wait)
+                metrics.observe("chatbot_queue_wait_seconds", wait)
+                job.task = self._loop.create_task(self._run(job))
+            self._publish()
+
+    def _release(self, job: _Job) -> None:
+        remaining = self._active.get(job.session_id, 1) - 1
+        if remaining:
+            self._active[job.session_id] = remaining
+        else:
+            self._active.pop(job.session_id, None)
+
+    def _publish(self) -> None:
+        # Called with the lock held, after every change to the queued and running counts
+        metrics.set_gauge("chatbot_executor_turns", self._queued, state="queued")
+        metrics.set_gauge("chatbot_executor_turns", self._running, state="running")
+
+    async def _run(self, job: _Job) -> None:
+        try:
+            with trace_turn(job.session_id) as trace:
+                config = traced_config(job.config, trace)
+                async for chunk in job.graph.astream(job.input, config=config, stream_mode=job.stream_mode):
+                    job.output.put(chunk)
+            self.completed += 1
+        except asyncio.CancelledError:
+            logger.info(f"Turn for session {job.session_id} cancelled")
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Turn for session {job.session_id} failed: {e}")
+            job.output.put(e)
+        finally:
+            job.output.put(_DONE)
+            with self._lock:
+                self._running -= 1
+                self._release(job)
+                self._publish()
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            queued, running = self._queued, self._running
+        return {
+            "queued": queued,
+            "running": running,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "queue_wait_p50": waits[len(waits) // 2] if waits else 0.0,
+            "queue_wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+        }
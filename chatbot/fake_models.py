@@ -0,0 +1,117 @@
+# Offline stand-in for the Mistral chat model, used by the benchmarks and CHAT_BACKEND=fake.
+# It streams a canned answer at a configurable latency and token rate, and when tools are bound it
+# answers a fresh human message with a tool call, as the real model usually does for `retrieve`.
+import json
+import time
+import uuid
+import random
+import asyncio
+from typing import Any, AsyncIterator, Iterator, List, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+from .streaming import chunks_to_message
+
+ANSWER = ("The tip of the endotracheal tube should sit about five centimetres above the carina, "
+          "roughly at the level of the medial ends of the clavicles. A nasogastric tube should run "
+          "down the midline, cross the diaphragm and end with its tip well inside the stomach. "
+          "Always check the whole course of each line before deciding it is correctly placed.")
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model with simulated latency.
+
+    Args:
+        latency: Median seconds before the first token.
+        latency_jitter: Sigma of the lognormal spread around `latency` (0 for a fixed delay).
+        tokens_per_second: Streaming rate after the first token; 0 streams without delay.
+        answer_words: Length of the answer in words (one token per word).
+        failure_rate: Probability that a call raises, for exercising retries and fallbacks.
+    """
+    latency: float = 0.3
+    latency_jitter: float = 0.0
+    tokens_per_second: float = 50.0
+    answer_words: int = 60
+    failure_rate: float = 0.0
+    seed: Optional[int] = None
+    model: str = "fake-chat"
+    _rng: random.Random = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": self.model}
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _first_token_delay(self) -> float:
+        if self.latency_jitter:
+            return self.latency * self._rng.lognormvariate(0.0, self.latency_jitter)
+        return self.latency
+
+    def _reply(self, messages: List[BaseMessage], tools: Optional[list]) -> List[AIMessageChunk]:
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise RuntimeError(f"{self.model}: simulated upstream failure")
+        last = messages[-1]
+        if tools and last.type == "human":
+            name = tools[0]["function"]["name"]
+            args = json.dumps({"query": str(last.content)})
+            return [AIMessageChunk(content="", tool_call_chunks=[
+                {"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}", "index": 0}])]
+        words = (ANSWER.split() * (self.answer_words // len(ANSWER.split()) + 1))[:self.answer_words]
+        chunks = [AIMessageChunk(content=word + " ") for word in words]
+        input_tokens = sum(len(str(message.content).split()) for message in messages)
+        chunks[-1] = AIMessageChunk(content=chunks[-1].content, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": len(words), "total_tokens": input_tokens + len(words)})
+        return chunks
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        chunks = self._reply(messages, kwargs.get("tools"))
+        time.sleep(self._first_token_delay())
+        for idx, chunk in enumerate(chunks):
+            if idx and self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        chunks = self._reply(messages, kwargs.get("tools"))
+        await asyncio.sleep(self._first_token_delay())
+        for idx, chunk in enumerate(chunks):
+            if idx and self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = None
+        for chunk in self._stream(messages, stop, run_manager, **kwargs):
+            message = chunk.message if message is None else message + chunk.message
+        return ChatResult(generations=[ChatGeneration(message=chunks_to_message(message))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = None
+        async for chunk in self._astream(messages, stop, run_manager, **kwargs):
+            message = chunk.message if message is None else message + chunk.message
+        return ChatResult(generations=[ChatGeneration(message=chunks_to_message(message))])
+
@@ -1,61 +1,178 @@
-import os
-import time
-from typing_extensions import List
-
-import streamlit as st
-from langchain_mistralai import ChatMistralAI, MistralAIEmbeddings
-from pinecone import Pinecone
-from langchain_pinecone import PineconeVectorStore
-from langgraph.graph import END, StateGraph, MessagesState
+import uuid
+import logging
+from typing import Optional
+from typing_extensions import Annotated, List
+
+from langgraph.graph import END, StateGraph
 from langgraph.graph.state import CompiledStateGraph
 from langchain_core.documents import Document
 from langchain_core.messages.human import HumanMessage
 from langchain_core.messages.ai import AIMessage
 from langchain_core.messages import SystemMessage
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain_core.prompts.chat import ChatPromptTemplate
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.prebuilt import ToolNode, tools_condition
-from langchain_core.rate_limiters import InMemoryRateLimiter
-from .embedding import MistralAIEmbeddingsWithPause
-
-rate_limiter = InMemoryRateLimiter(
-    requests_per_second=1,  # Can only make a request once every 1 second
-    check_every_n_seconds=0.5,  # Wake up every 500 ms to check whether allowed to make a request,
-    max_bucket_size=10,  # Controls the maximum burst size.
-)
-
-model = ChatMistralAI(model="ministral-8b-latest",
-                      api_key=st.secrets["MISTRAL_API_KEY"], rate_limiter=rate_limiter, temperature=0.63)
-pc = Pinecone(api_key=st.secrets["PINECONE_API_KEY"])
-lnt_index = pc.Index(name="diircb-lntguides")
-embed = MistralAIEmbeddingsWithPause(api_key=st.secrets["MISTRAL_EMBED_API_KEY"])
-vector_store = PineconeVectorStore(embedding=embed, index=lnt_index)
-
-
-def query_or_respond(state: MessagesState):
+from langgraph.prebuilt import InjectedState, ToolNode, tools_condition
+from .checkpoint import build_checkpointer
+from .context import ChatState, manage_context, with_summary
+from .lexical_index import reciprocal_rank_fusion
+from .router import condense_query, route_query
+from .resources import (get_chat_model, get_embeddings, get_lexical_index, get_retrieval_cache,
+                        get_speculative_retriever, get_vector_store)
+from .settings import get_setting
+from .tracing import metrics, span
+
+logger = logging.getLogger(__name__)
+
+def thread_scope(config: RunnableConfig) -> str:
+    return str(config.get("configurable", {}).get("thread_id", ""))
+
+
+def speculation_enabled() -> bool:
+    """Speculative retrieval overlaps with the LLM router's tool-calling call, so it only runs with ROUTER=llm."""
+    return get_setting("SPECULATIVE_RETRIEVAL", True) and get_setting("ROUTER", "local") == "llm"
+
+
+def speculate(state: ChatState, config: RunnableConfig) -> None:
+    """Start searching the guides for the user's message while the model decides on a tool call."""
+    last = state["messages"][-1]
+    if last.type == "human" and speculation_enabled():
+        get_speculative_retriever().submit(str(last.content), thread_scope(config))
+
+
+def query_or_respond(state: ChatState, config: RunnableConfig):
     """Generate tool call for retrieval or respond."""
-    llm_with_tools = model.bind_tools([retrieve])
-    response = llm_with_tools.invoke(state["messages"])
+    speculate(state, config)
+    llm_with_tools = get_chat_model().bind_tools([retrieve])
+    response = llm_with_tools.invoke(with_summary(state, state["messages"]))
     # MessagesState appends messages to state instead of overwriting
     return {"messages": [response]}
 
 
-@tool(response_format="content_and_artifact")
-def retrieve(query: str):
-    """Retrieve information related to a query. https://python.langchain.com/docs/how_to/qa_chat_history_how_to/ """
-    time.sleep(1.0)
-    retrieved_docs = vector_store.similarity_search(query, k=3)
-    serialized = "\n\n".join(
+async def aquery_or_respond(state: ChatState, config: RunnableConfig):
+    speculate(state, config)
+    llm_with_tools = get_chat_model().bind_tools([retrieve])
+    response = await llm_with_tools.ainvoke(with_summary(state, state["messages"]))
+    return {"messages": [response]}
+
+
+def local_route(state: ChatState):
+    """Call `retrieve` directly when the question matches the guides; otherwise leave it to `respond`."""
+    query = condense_query(state["messages"], min_terms=get_setting("ROUTER_CONDENSE_MIN_TERMS", 4))
+    decision = route_query(query)
+    if decision.route != "retrieve":
+        return {"route_hits": None}
+    route_hits = None
+    if decision.hits is not None:
+        route_hits = {"query": query, "embedding": decision.embedding, "docs": [doc for doc, _ in decision.hits]}
+    tool_call = {"name": retrieve.name, "args": {"query": query}, "id": f"route_{uuid.uuid4().hex[:12]}"}
+    return {"messages": [AIMessage("", tool_calls=[tool_call])], "route_hits": route_hits}
+
+
+def respond(state: ChatState):
+    """Answer directly, without tools or retrieved context."""
+    response = get_chat_model().invoke(with_summary(state, conversation_messages(state)))
+    return {"messages": [response]}
+
+
+async def arespond(state: ChatState):
+    response = await get_chat_model().ainvoke(with_summary(state, conversation_messages(state)))
+    return {"messages": [response]}
+
+
+def serialize_docs(docs: List[Document]) -> str:
+    return "\n\n".join(
         (f"Source: {doc.metadata}\n" f"Content: {doc.page_content}")
-        for doc in retrieved_docs
+        for doc in docs
     )
+
+
+@tool(response_format="content_and_artifact")
+def retrieve(query: str, state: Annotated[dict, InjectedState], config: RunnableConfig):
+    """Retrieve information related to a query. https://python.langchain.com/docs/how_to/qa_chat_history_how_to/ """
+    # Reuse the vector search made while routing this very query
+    route_hits = state.get("route_hits")
+    if route_hits and route_hits.get("query") == query:
+        return search_guides(query, route_hits)
+    # Reuse a speculative search for the user's message when the tool query is close to it
+    speculative = None
+    if speculation_enabled():
+        speculative = get_speculative_retriever().match(query, thread_scope(config))
+    if speculative is not None:
+        with span("retrieval", "speculative_wait", done=speculative.done()):
+            try:
+                return speculative.result()
+            except Exception as e:
+                logger.warning(f"Speculative retrieval failed, searching again: {e}")
+    return search_guides(query)
+
+
+def search_guides(query: str, route_hits: Optional[dict] = None):
+    """Cached hybrid/lexical/vector search returning the tool's (content, artifact) pair.
+
+    `route_hits` (query embedding and vector hits from routing) replaces the embedding call and vector search.
+    """
+    cache = get_retrieval_cache()
+    cached = cache.get_exact(query)
+    if cached is not None:
+        metrics.increment("chatbot_retrieval_cache_total", result="exact")
+        return cached
+    # RETRIEVAL_MODE: "hybrid" (BM25 + vector, BM25 alone for keyword queries), "lexical" or "vector"
+    mode = get_setting("RETRIEVAL_MODE", "hybrid")
+    lexical = get_lexical_index() if mode != "vector" else None
+    if lexical is not None and not len(lexical):
+        lexical = None
+    if lexical is not None and (mode == "lexical" or route_hits is None and lexical.is_keyword_query(
+            query, max_terms=get_setting("LEXICAL_FAST_MAX_TERMS", 4))):
+        # Keyword lookups skip the embedding call entirely
+        with span("retrieval", "lexical_search", mode="lexical"):
+            retrieved_docs = [doc for doc, _ in lexical.search(query, k=3)]
+        if retrieved_docs or mode == "lexical":
+            metrics.increment("chatbot_retrieval_total", mode="lexical")
+            result = (serialize_docs(retrieved_docs), retrieved_docs)
+            cache.put(query, None, result)
+            return result
+    # Embed once and reuse the vector for both the semantic cache lookup and the index search
+    if route_hits is not None:
+        embedding = route_hits["embedding"]
+    else:
+        with span("retrieval", "embed_query"):
+            embedding = get_embeddings().embed_query(query)
+    cached = cache.get_similar(embedding)
+    if cached is not None:
+        metrics.increment("chatbot_retrieval_cache_total", result="similar")
+        cache.put(query, embedding, cached)
+        return cached
+    metrics.increment("chatbot_retrieval_cache_total", result="miss")
+    fetch_k = 3 if lexical is None else 10
+    if route_hits is not None:
+        retrieved_docs = route_hits["docs"][:fetch_k]
+        metrics.increment("chatbot_route_hits_reused_total")
+    else:
+        with span("retrieval", "vector_search", k=fetch_k):
+            retrieved_docs = [doc for doc, _ in get_vector_store().similarity_search_by_vector_with_score(embedding, k=fetch_k)]
+    if lexical is not None:
+        with span("retrieval", "lexical_search", mode="hybrid"):
+            lexical_docs = [doc for doc, _ in lexical.search(query, k=fetch_k)]
+        retrieved_docs = reciprocal_rank_fusion([retrieved_docs, lexical_docs], k=3)
+    metrics.increment("chatbot_retrieval_total", mode="vector" if lexical is None else "hybrid")
+    serialized = serialize_docs(retrieved_docs)
+    cache.put(query, embedding, (serialized, retrieved_docs))
     return serialized, retrieved_docs
 
 
+def conversation_messages(state: ChatState) -> list:
+    """History without tool calls and tool results."""
+    return [
+        message
+        for message in state["messages"]
+        if message.type in ("human", "system")
+        or (message.type == "ai" and not message.tool_calls)
+    ]
+
+
 # Step 3: Generate a response using the retrieved content.
-def generate(state: MessagesState):
-    """Generate answer."""
+def generate_prompt(state: ChatState) -> list:
     # Get generated ToolMessages
     recent_tool_messages = []
     for message in reversed(state["messages"]):
@@ -74,29 +191,70 @@ def generate(state: MessagesState):
         "CONTEXT:"
         f"{docs_content}"
     )
-    conversation_messages = [
-        message
-        for message in state["messages"]
-        if message.type in ("human", "system")
-        or (message.type == "ai" and not message.tool_calls)
-    ]
-    prompt = [SystemMessage(system_message_content)] + conversation_messages
+    return [SystemMessage(system_message_content)] + with_summary(state, conversation_messages(state))
+
+
+def generate(state: ChatState):
+    """Generate answer."""
+    response = get_chat_model().invoke(generate_prompt(state))
+    return {"messages": [response]}
+
+
+async def agenerate(state: ChatState):
+    response = await get_chat_model().ainvoke(generate_prompt(state))
+    return {"messages": [response]}
 
-    # Run
-    response = model.invoke(prompt)
+
+def route_turn(state: ChatState) -> str:
+    """Stage submissions skip tool calling and are graded in a single model call. Questions are
+    routed locally unless ROUTER=llm, which lets the model decide whether to retrieve."""
+    last = state["messages"][-1]
+    if last.type == "human" and last.additional_kwargs.get("stage") is not None:
+        return "evaluate_stage"
+    if get_setting("ROUTER", "local") == "local":
+        return "local_route"
+    return "query_or_respond"
+
+
+def evaluate_stage(state: ChatState):
+    """Grade a stage submission built by chatbot.evaluation.StageEvaluator."""
+    response = get_chat_model().invoke(with_summary(state, conversation_messages(state)))
+    return {"messages": [response]}
+
+
+async def aevaluate_stage(state: ChatState):
+    response = await get_chat_model().ainvoke(with_summary(state, conversation_messages(state)))
     return {"messages": [response]}
 
 
 def build_graph() -> CompiledStateGraph:
     tools = ToolNode([retrieve])
-    graph_builder = StateGraph(MessagesState)
+    graph_builder = StateGraph(ChatState)
 
-    graph_builder.add_node(query_or_respond)
+    # Model nodes have async variants so graph.astream (used by GraphExecutor) awaits the API
+    # instead of holding a worker thread; graph.stream still uses the sync functions
+    graph_builder.add_node(manage_context)
+    graph_builder.add_node("query_or_respond", RunnableLambda(query_or_respond, aquery_or_respond))
 
     graph_builder.add_node(tools)
-    graph_builder.add_node(generate)
+    graph_builder.add_node("generate", RunnableLambda(generate, agenerate))
+    graph_builder.add_node("evaluate_stage", RunnableLambda(evaluate_stage, aevaluate_stage))
+    graph_builder.add_node(local_route)
+    graph_builder.add_node("respond", RunnableLambda(respond, arespond))
 
-    graph_builder.set_entry_point("query_or_respond")
+    graph_builder.set_entry_point("manage_context")
+    graph_builder.add_conditional_edges(
+        "manage_context",
+        route_turn,
+        {"evaluate_stage": "evaluate_stage", "query_or_respond": "query_or_respond", "local_route": "local_route"},
+    )
+    graph_builder.add_edge("evaluate_stage", END)
+    graph_builder.add_conditional_edges(
+        "local_route",
+        tools_condition,
+        {END: "respond", "tools": "tools"},
+    )
+    graph_builder.add_edge("respond", END)
     graph_builder.add_conditional_edges(
         "query_or_respond",
         tools_condition,
@@ -105,7 +263,7 @@ def build_graph() -> CompiledStateGraph:
     graph_builder.add_edge("tools", "generate")
     graph_builder.add_edge("generate", END)
 
-    memory = MemorySaver()
+    memory = build_checkpointer()
 
     graph = graph_builder.compile(checkpointer=memory)
     return graph
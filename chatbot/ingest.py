@@ -0,0 +1,401 @@
+# Headless ingestion of the guide corpus into the configured vector and lexical indexes.
+# Files stream through load → split → dedupe → embed → upsert stages connected by bounded queues,
+# so memory stays flat however large the corpus is. Splitting runs in a process pool; embedding
+# batches go through the configured embedder (concurrent and rate-limited for Mistral). The chunk
+# manifest and a small state file are checkpointed every few files, so an interrupted run resumes
+# where it stopped: finished files are skipped without being read and unchanged chunks are never
+# re-embedded. A running app loads its indexes at startup and must be restarted to see the changes.
+#
+#   python -m chatbot.ingest ./guides
+#   python -m chatbot.ingest ./guides --workers 8 --batch-size 128 --prune
+#   python -m chatbot.ingest ./guides --purge-untracked   # once, to drop vectors from before the manifest
+import os
+import sys
+import json
+import time
+import queue
+import fnmatch
+import logging
+import argparse
+import threading
+import multiprocessing
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from .manifest import ChunkManifest, chunk_ids, content_hash
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+DEFAULT_PATTERNS = ("*.md", "*.txt")
+
+
+def split_text(source: str, text: str) -> List[Tuple[str, dict]]:
+    """Split one file into chunks. Runs in a worker process, so it takes and returns plain data."""
+    from .chunking import split_documents
+    return [(chunk.page_content, chunk.metadata) for chunk in split_documents([Document(text, metadata={"source": source})])]
+
+
+def find_files(paths: Iterable[str], patterns: Iterable[str] = DEFAULT_PATTERNS) -> List[Tuple[str, str]]:
+    """(path, source name) for every matching file. Sources are relative to the directory given."""
+    found = []
+    for root in paths:
+        if os.path.isfile(root):
+            found.append((root, os.path.basename(root)))
+            continue
+        for directory, _, files in os.walk(root):
+            for name in sorted(files):
+                if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                    path = os.path.join(directory, name)
+                    found.append((path, os.path.relpath(path, root)))
+    return sorted(found)
+
+
+@dataclass
+class IngestStats():
+    files_total: int = 0
+    files_skipped: int = 0
+    files_done: int = 0
+    chunks_total: int = 0
+    chunks_unchanged: int = 0
+    chunks_embedded: int = 0
+    chunks_duplicate: int = 0
+    chunks_deleted: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks_embedded / self.elapsed if self.elapsed else 0.0
+
+
+@dataclass
+class _Source():
+    source: str
+    stamp: List[int]
+    ids: List[str]
+    chunks: List[Tuple[str, dict]]
+    new: List[int]
+
+
+def upsert_embeddings(vector_store, ids: List[str], texts: List[str], vectors: List[List[float]],
+                      metadatas: List[dict], batch_size: int = 100) -> None:
+    """Write precomputed vectors: LocalVectorStore.add_embeddings, or a direct Pinecone upsert."""
+    if hasattr(vector_store, "add_embeddings"):
+        vector_store.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids)
+        return
+    # PineconeVectorStore keeps the chunk text in the metadata under its text key
+    rows = [(id_, vector, {**metadata, vector_store._text_key: text})
+            for id_, text, vector, metadata in zip(ids, texts, vectors, metadatas)]
+    for start in range(0, len(rows), batch_size):
+        vector_store.index.upsert(vectors=rows[start:start + batch_size])
+
+
+def indexed_ids(vector_store) -> Iterator[str]:
+    """Every vector ID in the store: the local index's IDs, or a Pinecone (serverless) ID listing."""
+    if hasattr(vector_store, "add_embeddings"):
+        yield from list(vector_store._ids)
+        return
+    for page in vector_store.index.list(namespace=vector_store._namespace):
+        yield from page
+
+
+class IngestPipeline():
+    """Streaming ingestion into a vector store, its chunk manifest and (optionally) the BM25 index.
+
+    Args:
+        workers: Processes used for splitting.
+        batch_size: New chunks collected before an embedding call.
+        queue_size: Capacity of each queue between stages; a full queue blocks the stage before it.
+        state_path: JSON file listing finished files, used to resume. None disables resuming.
+        checkpoint_every: Files between checkpoints of the manifest, state file and lexical index.
+    """
+
+    def __init__(self, vector_store, manifest: ChunkManifest, embeddings, lexical=None, workers: int = 4,
+                 batch_size: int = 64, queue_size: int = 16, state_path: Optional[str] = None,
+                 checkpoint_every: int = 20, report_interval: float = 5.0):
+        self.vector_store = vector_store
+        self.manifest = manifest
+        self.embeddings = embeddings
+        self.lexical = lexical
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.state_path = state_path
+        self.checkpoint_every = checkpoint_every
+        self.report_interval = report_interval
+        self.stats = IngestStats()
+        self._done: Dict[str, List[int]] = {}
+        self._lexical_pending: List[Document] = []
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        if state_path and os.path.exists(state_path):
+            with open(state_path, "r") as f:
+                self._done = json.load(f)["files"]
+
+    # Plumbing
+
+    def _put(self, q: "queue.Queue", item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: "queue.Queue"):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _stage(self, target, *args) -> threading.Thread:
+        def run():
+            try:
+                target(*args)
+            except BaseException as e:
+                logger.exception(f"Ingestion stage {target.__name__} failed")
+                self._errors.append(e)
+                self._stop.set()
+        thread = threading.Thread(target=run, name=f"ingest-{target.__name__.strip('_')}", daemon=True)
+        thread.start()
+        return thread
+
+    # Stages
+
+    def _load(self, files: List[Tuple[str, str]], out: "queue.Queue") -> None:
+        for path, source in files:
+            stat = os.stat(path)
+            stamp = [stat.st_size, stat.st_mtime_ns]
+            if self._done.get(source) == stamp and self.manifest.known_ids(source):
+                self.stats.files_skipped += 1
+                continue
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                if not self._put(out, (source, stamp, f.read())):
+                    return
+        self._put(out, _END)
+
+    def _split(self, inp: "queue.Queue", out: "queue.Queue") -> None:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            pending = {}
+            finished = False
+            while pending or not finished:
+                # Keep a couple of files per worker in flight; the bounded input queue does the rest
+                while not finished and len(pending) < self.workers * 2:
+                    item = self._get(inp)
+                    if item is _END:
+                        finished = True
+                        break
+                    source, stamp, text = item
+                    pending[pool.submit(split_text, source, text)] = (source, stamp)
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    source, stamp = pending.pop(future)
+                    if not self._put(out, (source, stamp, future.result())):
+                        return
+        self._put(out, _END)
+
+    def _embed(self, inp: "queue.Queue", out: "queue.Queue") -> None:
+        batch: List[_Source] = []
+        size = 0
+        while True:
+            item = self._get(inp)
+            if item is _END:
+                break
+            source, stamp, chunks = item
+            ids = chunk_ids(source, [Document(text) for text, _ in chunks])
+            known = set(self.manifest.known_ids(source))
+            new = [idx for idx, id_ in enumerate(ids) if id_ not in known]
+            self.stats.chunks_total += len(ids)
+            self.stats.chunks_unchanged += len(ids) - len(new)
+            batch.append(_Source(source, stamp, ids, chunks, new))
+            size += len(new)
+            if size >= self.batch_size:
+                if not self._put(out, self._embed_batch(batch)):
+                    return
+                batch, size = [], 0
+        if batch:
+            self._put(out, self._embed_batch(batch))
+        self._put(out, _END)
+
+    def _embed_batch(self, batch: List[_Source]) -> Tuple[List[_Source], Dict[str, List[float]]]:
+        # Identical chunk texts (e.g. boilerplate repeated across guides) are embedded once
+        texts: Dict[str, str] = {}
+        for item in batch:
+            for idx in item.new:
+                texts.setdefault(content_hash(item.chunks[idx][0]), item.chunks[idx][0])
+        self.stats.chunks_duplicate += sum(len(item.new) for item in batch) - len(texts)
+        vectors = self.embeddings.embed_documents(list(texts.values())) if texts else []
+        return batch, dict(zip(texts.keys(), vectors))
+
+    def _upsert(self, batch: List[_Source], vectors: Dict[str, List[float]]) -> None:
+        ids, texts, embedded, metadatas = [], [], [], []
+        for item in batch:
+            for idx in item.new:
+                text, metadata = item.chunks[idx]
+                ids.append(item.ids[idx])
+                texts.append(text)
+                embedded.append(vectors[content_hash(text)])
+                metadatas.append({**metadata, "chunk_id": item.ids[idx]})
+        if ids:
+            upsert_embeddings(self.vector_store, ids, texts, embedded, metadatas)
+            self.stats.chunks_embedded += len(ids)
+        for item in batch:
+            stale = sorted(set(self.manifest.known_ids(item.source)) - set(item.ids))
+            if stale:
+                self.vector_store.delete(ids=stale)
+                self.stats.chunks_deleted += len(stale)
+            self.manifest.record(item.source, item.ids)
+            self._done[item.source] = item.stamp
+            if self.lexical is not None:
+                self._lexical_pending += [Document(text, metadata=metadata) for text, metadata in item.chunks]
+            self.stats.files_done += 1
+            if self.stats.files_done % self.checkpoint_every == 0:
+                self.checkpoint()
+
+    # Driver
+
+    def checkpoint(self) -> None:
+        """Persist progress. Vectors are always written before the manifest entry that lists them."""
+        if self.lexical is not None and self._lexical_pending:
+            self.lexical.sync(self._lexical_pending)
+            self._lexical_pending = []
+        if getattr(self.vector_store, "_dirty", False) and self.vector_store.path:
+            self.vector_store.save()
+        self.manifest.save()
+        if self.state_path:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            with open(f"{self.state_path}.tmp", "w") as f:
+                json.dump({"files": self._done}, f)
+            os.replace(f"{self.state_path}.tmp", self.state_path)
+
+    def prune(self, sources: Iterable[str]) -> int:
+        """Remove every indexed source not in `sources` from the vector index and the manifest."""
+        keep = set(sources)
+        gone = [source for source in list(self.manifest.sources) if source not in keep]
+        removed = 0
+        for source in gone:
+            ids = self.manifest.known_ids(source)
+            self.vector_store.delete(ids=ids)
+            self.manifest.record(source, [])
+            self._done.pop(source, None)
+            removed += len(ids)
+        if self.lexical is not None and gone:
+            self.lexical.remove_sources(gone)
+        self.stats.chunks_deleted += removed
+        return removed
+
+    def purge_untracked(self, batch_size: int = 1000) -> int:
+        """Delete every vector the manifest doesn't list, e.g. chunks indexed before the manifest existed.
+
+        Run it after a complete ingest: anything not recorded for a source is removed from the index.
+        """
+        untracked = self.manifest.untracked(indexed_ids(self.vector_store))
+        for start in range(0, len(untracked), batch_size):
+            self.vector_store.delete(ids=untracked[start:start + batch_size])
+        self.stats.chunks_deleted += len(untracked)
+        return len(untracked)
+
+    def _report(self, queues: Dict[str, "queue.Queue"]) -> None:
+        stats = self.stats
+        depth = ", ".join(f"{name} {q.qsize()}/{q.maxsize}" for name, q in queues.items())
+        logger.info(f"{stats.files_done + stats.files_skipped}/{stats.files_total} files, "
+                    f"{stats.chunks_embedded} chunks embedded ({stats.chunks_per_second:.1f}/s), "
+                    f"{stats.chunks_unchanged} unchanged; queues: {depth}")
+
+    def run(self, files: List[Tuple[str, str]]) -> IngestStats:
+        self.stats = IngestStats(files_total=len(files))
+        queues = {"load": queue.Queue(self.queue_size), "split": queue.Queue(self.queue_size),
+                  "embed": queue.Queue(2)}
+        stages = [self._stage(self._load, files, queues["load"]),
+                  self._stage(self._split, queues["load"], queues["split"]),
+                  self._stage(self._embed, queues["split"], queues["embed"])]
+        last_report = time.perf_counter()
+        # A local index is saved at checkpoints rather than after every batch
+        saving = self.vector_store.deferred_save() if hasattr(self.vector_store, "deferred_save") else nullcontext()
+        try:
+            with saving:
+                while True:
+                    item = self._get(queues["embed"])
+                    if item is _END:
+                        break
+                    self._upsert(*item)
+                    if time.perf_counter() - last_report >= self.report_interval:
+                        self._report(queues)
+                        last_report = time.perf_counter()
+        except BaseException as e:
+            self._errors.append(e)
+        finally:
+            self._stop.set()
+            for stage in stages:
+                stage.join()
+            # Whatever was upserted is recorded, so a rerun continues from here
+            self.checkpoint()
+        self._report(queues)
+        if self._errors:
+            raise self._errors[0]
+        return self.stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chatbot.ingest",
+                                     description="Index guide documents into the configured vector and BM25 indexes.")
+    parser.add_argument("paths", nargs="+", help="Files or directories to ingest")
+    parser.add_argument("--pattern", action="append", help="File name pattern (default: *.md and *.txt)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Splitting processes")
+    parser.add_argument("--batch-size", type=int, default=64, help="New chunks per embedding call")
+    parser.add_argument("--queue-size", type=int, default=16, help="Capacity of the queues between stages")
+    parser.add_argument("--checkpoint-every", type=int, default=20, help="Files between checkpoints")
+    parser.add_argument("--state", default="./data/ingest_state.json", help="Resume state file")
+    parser.add_argument("--restart", action="store_true", help="Ignore the resume state and re-check every file")
+    parser.add_argument("--prune", action="store_true", help="Remove indexed sources that are no longer on disk")
+    parser.add_argument("--purge-untracked", action="store_true",
+                        help="Delete vectors the manifest doesn't list (one-off migration of a pre-manifest index)")
+    parser.add_argument("--no-lexical", action="store_true", help="Don't build the BM25 index")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    from .resources import get_chunk_manifest, get_embeddings, get_lexical_index, get_vector_store
+
+    if args.restart and os.path.exists(args.state):
+        os.remove(args.state)
+    files = find_files(args.paths, args.pattern or DEFAULT_PATTERNS)
+    pipeline = IngestPipeline(get_vector_store(), get_chunk_manifest(), get_embeddings(),
+                              lexical=None if args.no_lexical else get_lexical_index(), workers=args.workers,
+                              batch_size=args.batch_size, queue_size=args.queue_size, state_path=args.state,
+                              checkpoint_every=args.checkpoint_every)
+    try:
+        stats = pipeline.run(files)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; progress was checkpointed, rerun the same command to resume")
+        return 130
+    if args.prune:
+        removed = pipeline.prune(source for _, source in files)
+        pipeline.checkpoint()
+        logger.info(f"Pruned {removed} chunks of sources no longer on disk")
+    if args.purge_untracked:
+        purged = pipeline.purge_untracked()
+        pipeline.checkpoint()
+        logger.info(f"Purged {purged} vectors not listed in the chunk manifest")
+    logger.info(f"Done in {stats.elapsed:.1f}s: " + ", ".join(f"{key} {value}" for key, value in asdict(stats).items()
+                                                            if key != "started"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
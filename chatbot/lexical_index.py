@@ -0,0 +1,223 @@
+# BM25 inverted index over the guide chunks, built at ingest next to the vector index.
+# Postings are stored as flat NumPy arrays (`offsets.npy`, `postings.npy`, `tfs.npy`,
+# `doc_lens.npy`) and memory-mapped on load; the vocabulary and the chunk texts are JSON. A query
+# needs no embedding call, so exact terms like "carina", "T4" or "NG tube" are matched locally,
+# and `reciprocal_rank_fusion` merges the lexical and vector rankings for the `retrieve` tool.
+import os
+import re
+import json
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .manifest import chunk_ids
+
+logger = logging.getLogger(__name__)
+
+# Shared by BM25, the router and stage grading (chatbot.evaluation.key_terms)
+STOPWORDS = frozenset("""
+a also an and any are as at be because been but by can could do does did for from has have how i if
+in into is it its may me more most my no not of on or should so such than that the their them then
+there these this those to up use used using was were what when where which while who why will with
+would you your
+""".split())
+
+_ARRAYS = ("offsets", "postings", "tfs", "doc_lens")
+
+
+def content_words(text: str) -> List[str]:
+    """Lowercase alphanumeric words without stopwords, as written."""
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS]
+
+
+def tokenize(text: str) -> List[str]:
+    """`content_words` with a trailing plural "s" dropped, the terms BM25 indexes."""
+    terms = []
+    for word in content_words(text):
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Document]], k: int = 3, rrf_k: int = 60) -> List[Document]:
+    """Merge ranked document lists; a document scores 1 / (rrf_k + rank) in every list it appears in."""
+    scores: Dict[str, float] = defaultdict(float)
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc.metadata.get("chunk_id") or doc.id or doc.page_content
+            scores[key] += 1 / (rrf_k + rank + 1)
+            documents.setdefault(key, doc)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+
+class LexicalIndex():
+    """BM25 index with save/load to a directory.
+
+    Args:
+        path: Directory to persist to. When set, every sync is saved straight away.
+        k1, b: BM25 term-frequency saturation and length normalisation.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._vocabulary: Dict[str, int] = {}
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._avg_len = 0.0
+        self._arrays: Dict[str, np.ndarray] = {name: np.zeros(0, dtype=np.int32) for name in _ARRAYS}
+        self._arrays["offsets"] = np.zeros(1, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _compile(self) -> None:
+        """Rebuild the postings arrays from the stored texts."""
+        counts = [Counter(tokenize(text)) for text in self._texts]
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc, counter in enumerate(counts):
+            for term, tf in counter.items():
+                postings[term].append((doc, tf))
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        flat = [entry for term in terms for entry in postings[term]]
+        doc_lens = np.array([sum(counter.values()) for counter in counts], dtype=np.int32)
+        self._vocabulary = {term: idx for idx, term in enumerate(terms)}
+        self._arrays = {
+            "offsets": offsets,
+            "postings": np.array([doc for doc, _ in flat], dtype=np.int32),
+            "tfs": np.minimum(np.array([tf for _, tf in flat], dtype=np.int64), 65535).astype(np.uint16),
+            "doc_lens": doc_lens,
+        }
+        self._finish()
+
+    def _finish(self) -> None:
+        n = len(self._ids)
+        df = np.diff(self._arrays["offsets"]).astype(np.float32)
+        self._idf = np.log(1 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self._avg_len = float(self._arrays["doc_lens"].mean()) if n else 0.0
+
+    def sync(self, chunks: List[Document]) -> Tuple[int, int]:
+        """Make the index match `chunks` for every source they come from, like ChunkManifest.sync.
+
+        Chunk IDs are the manifest's, so lexical and vector results can be fused by ID.
+        Returns the number of chunks added and removed.
+        """
+        by_source: Dict[str, List[Document]] = defaultdict(list)
+        for chunk in chunks:
+            by_source[chunk.metadata.get("source", "")].append(chunk)
+        with self._lock:
+            wanted: Dict[str, Tuple[str, dict]] = {}
+            for source, source_chunks in by_source.items():
+                for id_, chunk in zip(chunk_ids(source, source_chunks), source_chunks):
+                    wanted[id_] = (chunk.page_content, {**chunk.metadata, "chunk_id": id_})
+            keep = [idx for idx, metadata in enumerate(self._metadatas)
+                    if metadata.get("source", "") not in by_source or self._ids[idx] in wanted]
+            removed = len(self._ids) - len(keep)
+            known = set(self._ids[idx] for idx in keep)
+            added = [id_ for id_ in wanted if id_ not in known]
+            if not added and not removed:
+                return 0, 0
+            self._ids = [self._ids[idx] for idx in keep] + added
+            self._texts = [self._texts[idx] for idx in keep] + [wanted[id_][0] for id_ in added]
+            self._metadatas = [self._metadatas[idx] for idx in keep] + [wanted[id_][1] for id_ in added]
+            self._compile()
+        if self.path:
+            self.save()
+        logger.info(f"Lexical index sync: {len(added)} added, {removed} removed, {len(self)} chunks")
+        return len(added), removed
+
+    def remove_sources(self, sources: Iterable[str]) -> int:
+        """Drop every chunk of the given sources. Returns the number of chunks removed."""
+        sources = set(sources)
+        with self._lock:
+            keep = [idx for idx, metadata in enumerate(self._metadatas) if metadata.get("source", "") not in sources]
+            removed = len(self._ids) - len(keep)
+            if not removed:
+                return 0
+            self._ids = [self._ids[idx] for idx in keep]
+            self._texts = [self._texts[idx] for idx in keep]
+            self._metadatas = [self._metadatas[idx] for idx in keep]
+            self._compile()
+        if self.path:
+            self.save()
+        return removed
+
+    def is_keyword_query(self, query: str, max_terms: int = 4, min_content_ratio: float = 0.6) -> bool:
+        """Short queries made mostly of indexed terms, e.g. "NG tube position" or "carina T4"."""
+        words = re.findall(r"[a-z0-9]+", query.lower())
+        terms = tokenize(query)
+        if not terms or len(terms) > max_terms or len(terms) / len(words) < min_content_ratio:
+            return False
+        return all(term in self._vocabulary for term in terms)
+
+    def term_coverage(self, query: str) -> float:
+        """Share of the query's terms that occur somewhere in the index (0 when it has none)."""
+        terms = tokenize(query)
+        return sum(term in self._vocabulary for term in terms) / len(terms) if terms else 0.0
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """Top `k` chunks by BM25 score. Chunks sharing no term with the query are not returned."""
+        terms = tokenize(query)
+        with self._lock:
+            n = len(self._ids)
+            term_ids = [self._vocabulary[term] for term in terms if term in self._vocabulary]
+            if not n or not term_ids:
+                return []
+            offsets, postings, tfs = self._arrays["offsets"], self._arrays["postings"], self._arrays["tfs"]
+            doc_lens = np.asarray(self._arrays["doc_lens"], dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * doc_lens / (self._avg_len or 1.0))
+            scores = np.zeros(n, dtype=np.float32)
+            for term_id in term_ids:
+                start, end = offsets[term_id], offsets[term_id + 1]
+                docs = postings[start:end]
+                tf = tfs[start:end].astype(np.float32)
+                scores[docs] += self._idf[term_id] * tf * (self.k1 + 1) / (tf + norm[docs])
+            hits = np.flatnonzero(scores)
+            if len(hits) > k:
+                hits = hits[np.argpartition(-scores[hits], k)[:k]]
+            hits = hits[np.argsort(-scores[hits])]
+            return [(Document(id=self._ids[idx], page_content=self._texts[idx], metadata=self._metadatas[idx]),
+                     float(scores[idx])) for idx in hits]
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = path or self.path
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            docs = {"ids": self._ids, "texts": self._texts, "metadatas": self._metadatas,
+                    "terms": sorted(self._vocabulary, key=self._vocabulary.get)}
+            arrays = {name: np.asarray(array) for name, array in self._arrays.items()}
+        # Write to temporary files first so a crash never leaves a half-written index
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.tmp.npy"), array)
+        with open(os.path.join(path, "docs.tmp.json"), "w") as f:
+            json.dump(docs, f)
+        for name in _ARRAYS:
+            os.replace(os.path.join(path, f"{name}.tmp.npy"), os.path.join(path, f"{name}.npy"))
+        os.replace(os.path.join(path, "docs.tmp.json"), os.path.join(path, "docs.json"))
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "LexicalIndex":
+        """Open the index saved in `path` (memory-mapping the postings), or an empty one if there is none."""
+        index = cls(path=path, **kwargs)
+        if not os.path.exists(os.path.join(path, "docs.json")):
+            return index
+        with open(os.path.join(path, "docs.json"), "r") as f:
+            docs = json.load(f)
+        index._ids, index._texts, index._metadatas = docs["ids"], docs["texts"], docs["metadatas"]
+        index._vocabulary = {term: idx for idx, term in enumerate(docs["terms"])}
+        index._arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        index._finish()
+        logger.info(f"Loaded lexical index with {len(index)} chunks and {len(index._vocabulary)} terms from {path}")
+        return index
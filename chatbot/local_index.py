@@ -0,0 +1,266 @@
+# In-process vector index, an offline alternative to the Pinecone index.
+# Vectors are unit-normalised float32 rows in `vectors.npy` (memory-mapped on load) and documents
+# are kept alongside in `docs.json`. Search is an exact dot product by default; with
+# `approximate=True` a small IVF (k-means) partitioning restricts search to the closest lists.
+# Writers never modify the arrays and lists in place; they build new ones and swap them in under
+# the lock, so a search takes a consistent snapshot under the lock and then runs without it.
+import os
+import re
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from .vectors import unit_vectors
+
+logger = logging.getLogger(__name__)
+
+
+class StubEmbeddings(Embeddings):
+    """Deterministic offline embedder: hashed bag of words and character trigrams.
+
+    Similar wording gives similar vectors, which is enough for tests, benchmarks and running
+    without an API key. Not a substitute for a real embedding model.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.model = f"stub-{dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = re.findall(r"\w+", text.lower())
+        features = words + [word[i:i + 3] for word in words for i in range(max(len(word) - 2, 1))]
+        for feature in features:
+            digest = hashlib.md5(feature.encode("utf-8")).digest()
+            idx = int.from_bytes(digest[:4], "little") % self.dim
+            vector[idx] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class LocalVectorStore(VectorStore):
+    """NumPy-backed vector store with save/load to a directory.
+
+    Args:
+        embedding: Embedding model used for documents and queries.
+        path: Directory to persist to. When set, every add/delete is saved straight away.
+        approximate: Use IVF search instead of an exact scan once the index has `min_ivf_size` rows.
+        n_probe: Number of IVF lists searched per query.
+    """
+
+    def __init__(self, embedding: Embeddings, path: Optional[str] = None, approximate: bool = False,
+                 n_probe: int = 4, min_ivf_size: int = 1024):
+        self.embedding = embedding
+        self.path = path
+        self.approximate = approximate
+        self.n_probe = n_probe
+        self.min_ivf_size = min_ivf_size
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._ivf: Optional[Tuple[np.ndarray, List[np.ndarray]]] = None
+        self._defer_save = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # Writing
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas=metadatas, ids=ids)
+
+    def add_embeddings(self, texts: List[str], embeddings: List[List[float]], metadatas: Optional[List[dict]] = None,
+                       ids: Optional[List[str]] = None) -> List[str]:
+        """Add texts whose embeddings were already computed, e.g. by the ingestion pipeline."""
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [id_ or uuid.uuid4().hex for id_ in ids] if ids else [uuid.uuid4().hex for _ in texts]
+        vectors = unit_vectors(embeddings)
+        with self._lock:
+            # Re-adding an existing ID replaces it, as Pinecone upserts do
+            self._remove(set(ids))
+            self._vectors = vectors if not len(self._ids) else np.vstack([self._vectors, vectors])
+            self._ids = self._ids + ids
+            self._texts = self._texts + texts
+            self._metadatas = self._metadatas + [dict(metadata) for metadata in metadatas]
+            self._ivf = None
+            self._dirty = True
+        if self.path and not self._defer_save:
+            self.save()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock:
+            removed = self._remove(set(ids))
+        if removed and self.path and not self._defer_save:
+            self.save()
+        return removed > 0
+
+    @contextmanager
+    def deferred_save(self) -> Iterator[None]:
+        """Save once when the block exits instead of after every add and delete."""
+        self._defer_save += 1
+        try:
+            yield
+        finally:
+            self._defer_save -= 1
+            if not self._defer_save and self.path and self._dirty:
+                self.save()
+
+    def _remove(self, ids: set) -> int:
+        keep = [idx for idx, id_ in enumerate(self._ids) if id_ not in ids]
+        removed = len(self._ids) - len(keep)
+        if removed:
+            self._vectors = self._vectors[keep]
+            self._ids = [self._ids[idx] for idx in keep]
+            self._texts = [self._texts[idx] for idx in keep]
+            self._metadatas = [self._metadatas[idx] for idx in keep]
+            self._ivf = None
+            self._dirty = True
+        return removed
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        snapshot = self._snapshot()
+        positions = {id_: idx for idx, id_ in enumerate(snapshot.ids)}
+        return [snapshot.document(positions[id_]) for id_ in ids if id_ in positions]
+
+    # Searching
+
+    def _snapshot(self) -> "_Snapshot":
+        with self._lock:
+            return _Snapshot(self._vectors, self._ids, self._texts, self._metadatas, self._ivf)
+
+    def _candidates(self, snapshot: "_Snapshot", query: np.ndarray) -> Optional[np.ndarray]:
+        if not self.approximate or len(snapshot.ids) < self.min_ivf_size:
+            return None
+        ivf = snapshot.ivf
+        if ivf is None:
+            ivf = _build_ivf(np.asarray(snapshot.vectors))
+            with self._lock:
+                # Only keep the lists if no write replaced the vectors while they were built
+                if self._vectors is snapshot.vectors:
+                    self._ivf = ivf
+        centroids, lists = ivf
+        probe = np.argsort(-(centroids @ query))[:self.n_probe]
+        return np.concatenate([lists[idx] for idx in probe])
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        snapshot = self._snapshot()
+        if not snapshot.ids:
+            return []
+        query = unit_vectors(embedding)
+        candidates = self._candidates(snapshot, query)
+        vectors = snapshot.vectors if candidates is None else snapshot.vectors[candidates]
+        scores = vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        positions = top if candidates is None else candidates[top]
+        return [(snapshot.document(int(idx)), float(score)) for idx, score in zip(positions, scores[top])]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k=k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities in [-1, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    # Persistence
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = path or self.path
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            vectors = np.asarray(self._vectors)
+            docs = {"ids": self._ids, "texts": self._texts, "metadatas": self._metadatas}
+            self._dirty = False
+        # Write to temporary files first so a crash never leaves a half-written index
+        np.save(os.path.join(path, "vectors.tmp.npy"), vectors)
+        with open(os.path.join(path, "docs.tmp.json"), "w") as f:
+            json.dump(docs, f)
+        os.replace(os.path.join(path, "vectors.tmp.npy"), os.path.join(path, "vectors.npy"))
+        os.replace(os.path.join(path, "docs.tmp.json"), os.path.join(path, "docs.json"))
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings, **kwargs: Any) -> "LocalVectorStore":
+        """Open the index saved in `path` (memory-mapping the vectors), or an empty one if there is none."""
+        store = cls(embedding, path=path, **kwargs)
+        if not os.path.exists(os.path.join(path, "docs.json")):
+            return store
+        with open(os.path.join(path, "docs.json"), "r") as f:
+            docs = json.load(f)
+        store._ids, store._texts, store._metadatas = docs["ids"], docs["texts"], docs["metadatas"]
+        store._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        logger.info(f"Loaded local index with {len(store)} vectors from {path}")
+        return store
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, **kwargs: Any) -> "LocalVectorStore":
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+class _Snapshot(NamedTuple):
+    """The index as of one moment; writers swap in new arrays and lists instead of changing these."""
+    vectors: np.ndarray
+    ids: List[str]
+    texts: List[str]
+    metadatas: List[dict]
+    ivf: Optional[Tuple[np.ndarray, List[np.ndarray]]]
+
+    def document(self, idx: int) -> Document:
+        return Document(id=self.ids[idx], page_content=self.texts[idx], metadata=dict(self.metadatas[idx]))
+
+
+def _build_ivf(vectors: np.ndarray, iterations: int = 10) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Spherical k-means with sqrt(N) lists; returns centroids and the row indices in each list."""
+    n_lists = max(int(np.sqrt(len(vectors))), 1)
+    rng = np.random.default_rng(0)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for idx in range(n_lists):
+            members = vectors[assignment == idx]
+            if len(members):
+                centroids[idx] = members.mean(axis=0)
+        centroids = unit_vectors(centroids)
+    assignment = np.argmax(vectors @ centroids.T, axis=1)
+    return centroids, [np.flatnonzero(assignment == idx) for idx in range(n_lists)]
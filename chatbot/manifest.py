@@ -0,0 +1,114 @@
+# Persistent record of which chunks are in the vector index, used to re-index incrementally.
+# Chunk IDs are derived from the source name and a hash of the chunk text, so an unchanged chunk
+# always gets the same ID: re-ingesting a source only embeds chunks whose text is new and deletes
+# vectors for chunks that are no longer produced. Vectors written before the manifest existed
+# (the embedding notebook's random IDs, without a chunk_id) are not tracked, so re-ingesting their
+# sources adds a second copy; remove them once with `python -m chatbot.ingest ... --purge-untracked`.
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_ids(source: str, chunks: List[Document]) -> List[str]:
+    """Stable IDs for a source's chunks; repeated identical chunks get an occurrence suffix."""
+    seen: Dict[str, int] = defaultdict(int)
+    ids = []
+    for chunk in chunks:
+        base = hashlib.sha256(f"{source}\x00{content_hash(chunk.page_content)}".encode("utf-8")).hexdigest()[:32]
+        ids.append(base if seen[base] == 0 else f"{base}-{seen[base]}")
+        seen[base] += 1
+    return ids
+
+
+@dataclass
+class SyncResult():
+    added: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+
+class ChunkManifest():
+    """JSON file mapping each source name to the IDs of its chunks currently in the index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sources: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.sources = json.load(f)["sources"]
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"sources": self.sources}, f)
+        os.replace(tmp_path, self.path)
+
+    def known_ids(self, source: str) -> List[str]:
+        with self._lock:
+            return list(self.sources.get(source, []))
+
+    def untracked(self, ids: Iterable[str]) -> List[str]:
+        """The IDs in `ids` that are not recorded for any source."""
+        with self._lock:
+            tracked = {id_ for source_ids in self.sources.values() for id_ in source_ids}
+        return [id_ for id_ in ids if id_ not in tracked]
+
+    def record(self, source: str, ids: List[str]) -> None:
+        """Set the IDs indexed for `source` (forgetting it when `ids` is empty). Call save() to persist."""
+        with self._lock:
+            if ids:
+                self.sources[source] = list(ids)
+            else:
+                self.sources.pop(source, None)
+
+    def sync(self, vector_store, chunks: List[Document]) -> SyncResult:
+        """Bring the index in line with `chunks` for every source they come from.
+
+        Sources not present in `chunks` are left alone. New chunks are added under their stable IDs,
+        chunks that disappeared from a source are deleted, and the manifest is saved only after the
+        index has been updated, so an interrupted sync is simply redone next time.
+        """
+        by_source: Dict[str, List[Document]] = defaultdict(list)
+        for chunk in chunks:
+            by_source[chunk.metadata.get("source", "")].append(chunk)
+
+        result = SyncResult()
+        with self._lock:
+            new_docs, new_ids, updated = [], [], {}
+            for source, source_chunks in by_source.items():
+                ids = chunk_ids(source, source_chunks)
+                known = set(self.sources.get(source, []))
+                for id_, chunk in zip(ids, source_chunks):
+                    if id_ in known:
+                        result.unchanged += 1
+                    else:
+                        chunk.metadata["chunk_id"] = id_
+                        new_docs.append(chunk)
+                        new_ids.append(id_)
+                result.deleted += sorted(known - set(ids))
+                updated[source] = ids
+            if new_docs:
+                vector_store.add_documents(new_docs, ids=new_ids)
+                result.added = new_ids
+            if result.deleted:
+                vector_store.delete(ids=result.deleted)
+            self.sources.update(updated)
+            self.save()
+        logger.info(f"Chunk sync: {len(result.added)} added, {len(result.deleted)} deleted, "
+                    f"{result.unchanged} unchanged")
+        return result
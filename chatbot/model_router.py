@@ -0,0 +1,461 @@
+# Tail-latency control for chat model calls: tiers, deadlines, hedging and circuit breakers.
+# `RoutedChatModel` stands in for the chat model and streams from the first healthy tier. A call
+# that has not produced its first token after the tier's recent p95 time to first token is
+# hedged: the same request is sent again and whichever attempt streams first wins. On the async
+# path the losing attempt's task (and so its HTTP request) is cancelled; on the sync path its
+# thread stops and closes its stream at its next chunk, but a request still waiting for its first
+# token runs until it answers or times out. Hedges are capped at `hedge_budget` of the tier's
+# recent calls and skipped while its rate limiter has no tokens, so a slow provider is never sent
+# double the load. A tier that errors, misses its first-token deadline or ends without output
+# before streaming fails over to the next tier, and a tier that keeps failing is skipped by its
+# circuit breaker until `reset_timeout` has passed, after which a single trial call decides
+# whether it closes again. Inner models are called without callbacks, so only the winning
+# attempt's tokens reach the graph's stream.
+import time
+import queue
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+from .streaming import EmptyResponseError, chunks_to_message
+from .tracing import metrics, span
+
+logger = logging.getLogger(__name__)
+
+
+class ModelTimeoutError(TimeoutError):
+    pass
+
+
+class CircuitBreaker():
+    """Opens after `failure_threshold` consecutive failures; lets one trial call through after `reset_timeout`."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead. In the half-open state only the caller claiming the trial slot may."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            # A trial whose caller never reported back (e.g. it was abandoned) is given up after reset_timeout
+            if self._trial_started is not None and now - self._trial_started < self.reset_timeout:
+                return False
+            self._trial_started = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit for {self.name} closed")
+            self.failures = 0
+            self.opened_at = None
+            self._trial_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                # A failed trial call in the half-open state re-opens the circuit for another period
+                if self.opened_at is None:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                    metrics.increment("chatbot_model_circuit_open_total", model=self.name)
+                self.opened_at = time.monotonic()
+                self._trial_started = None
+
+
+class LatencyTracker():
+    """Recent time-to-first-token samples of one tier, for the hedging threshold."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)] if ordered else None
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class HedgeBudget():
+    """Allows hedges for at most `fraction` of the last `window` calls (and always at least one)."""
+
+    def __init__(self, fraction: float = 0.1, window: int = 200):
+        self.fraction = fraction
+        self._calls: deque = deque(maxlen=window)
+        self._hedges: deque = deque()
+        self._lock = threading.Lock()
+
+    def record_call(self) -> None:
+        with self._lock:
+            self._calls.append(time.monotonic())
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            # Only hedges made during the calls still in the window count against the budget
+            while self._hedges and self._calls and self._hedges[0] < self._calls[0]:
+                self._hedges.popleft()
+            if len(self._hedges) + 1 > max(1.0, self.fraction * len(self._calls)):
+                return False
+            self._hedges.append(time.monotonic())
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": len(self._calls), "hedges": len(self._hedges)}
+
+
+class RoutedChatModel(BaseChatModel):
+    """Streams from `tiers` in order of preference, with hedging, deadlines and failover.
+
+    Args:
+        tiers: Chat models, primary first.
+        first_token_timeout: Seconds an attempt may take to its first token before the tier fails over.
+        deadline: Seconds a whole call may take, including streaming.
+        hedge: Send a duplicate request when the first token is late.
+        hedge_quantile: Quantile of the tier's recent TTFTs after which to hedge.
+        hedge_initial: Hedge delay until `hedge_min_samples` TTFTs have been seen.
+        hedge_min_delay: Lower bound on the hedge delay, so fast tails don't double every call.
+        hedge_budget: Largest share of a tier's recent calls that may be hedged.
+    """
+    tiers: List[BaseChatModel]
+    first_token_timeout: float = 30.0
+    deadline: float = 120.0
+    hedge: bool = True
+    hedge_quantile: float = 0.95
+    hedge_initial: float = 3.0
+    hedge_min_delay: float = 0.2
+    hedge_min_samples: int = 20
+    hedge_budget: float = 0.1
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+    _breakers: List[CircuitBreaker] = PrivateAttr()
+    _latencies: List[LatencyTracker] = PrivateAttr()
+    _budgets: List[HedgeBudget] = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._breakers = [CircuitBreaker(self._name(idx), self.failure_threshold, self.reset_timeout)
+                          for idx in range(len(self.tiers))]
+        self._latencies = [LatencyTracker() for _ in self.tiers]
+        self._budgets = [HedgeBudget(self.hedge_budget) for _ in self.tiers]
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-chat"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": "|".join(self._name(idx) for idx in range(len(self.tiers)))}
+
+    def _name(self, idx: int) -> str:
+        tier = self.tiers[idx]
+        return str(getattr(tier, "model", None) or getattr(tier, "model_name", None) or f"tier{idx}")
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def hedge_delay(self, idx: int) -> Optional[float]:
+        """Seconds to wait for a first token before hedging, or None when hedging is off."""
+        if not self.hedge:
+            return None
+        latencies = self._latencies[idx]
+        if len(latencies) < self.hedge_min_samples:
+            return self.hedge_initial
+        return max(self.hedge_min_delay, latencies.quantile(self.hedge_quantile))
+
+    def _can_hedge(self, idx: int) -> bool:
+        """Whether a duplicate request may be sent to tier `idx` now; spends hedge budget if so."""
+        limiter = getattr(self.tiers[idx], "rate_limiter", None)
+        if limiter is not None and hasattr(limiter, "has_capacity") and not limiter.has_capacity():
+            reason = "rate_limited"
+        elif not self._budgets[idx].try_spend():
+            reason = "budget"
+        else:
+            return True
+        metrics.increment("chatbot_model_hedges_skipped_total", model=self._name(idx), reason=reason)
+        return False
+
+    def _order(self) -> Iterator[int]:
+        """Tiers whose circuit allows a call; every tier when all circuits are open, rather than failing outright.
+
+        Circuits are asked lazily, so a half-open tier's trial slot is only claimed when that tier is called.
+        """
+        tried = False
+        for idx, breaker in enumerate(self._breakers):
+            if breaker.allow():
+                tried = True
+                yield idx
+        if not tried:
+            yield from range(len(self.tiers))
+
+    def _succeeded(self, idx: int, ttft: float, hedged: bool, winner: int) -> None:
+        self._breakers[idx].record_success()
+        self._latencies[idx].add(ttft)
+        metrics.observe("chatbot_model_ttft_seconds", ttft, model=self._name(idx))
+        metrics.increment("chatbot_model_calls_total", model=self._name(idx), result="ok")
+        if hedged:
+            metrics.increment("chatbot_model_hedges_total", model=self._name(idx),
+                              winner="primary" if winner == 0 else "hedge")
+
+    def _failed(self, idx: int, error: BaseException) -> None:
+        self._breakers[idx].record_failure()
+        result = "timeout" if isinstance(error, ModelTimeoutError) else "error"
+        metrics.increment("chatbot_model_calls_total", model=self._name(idx), result=result)
+        logger.warning(f"Chat model {self._name(idx)} failed ({result}): {error}")
+
+    # Sync path: each attempt streams on its own thread into a shared queue
+
+    def _start_attempt(self, idx: int, attempt: int, messages: List[BaseMessage], stop: Optional[List[str]],
+                       kwargs: dict, out: "queue.Queue", cancelled: threading.Event) -> None:
+        def pump():
+            stream = self.tiers[idx].stream(messages, config={"callbacks": []}, stop=stop, **kwargs)
+            try:
+                for chunk in stream:
+                    if cancelled.is_set():
+                        return
+                    out.put((attempt, "chunk", chunk))
+                out.put((attempt, "end", None))
+            except BaseException as e:
+                out.put((attempt, "error", e))
+            finally:
+                # Closing the generator closes the provider's streaming response
+                stream.close()
+        threading.Thread(target=pump, name=f"model-{self._name(idx)}-{attempt}", daemon=True).start()
+
+    def _stream_tier(self, idx: int, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict,
+                     deadline: float) -> Iterator[AIMessageChunk]:
+        out: "queue.Queue" = queue.Queue()
+        cancelled = [threading.Event(), threading.Event()]
+        started = time.monotonic()
+        first_token_deadline = min(started + self.first_token_timeout, deadline)
+        delay = self.hedge_delay(idx)
+        hedge_at = None if delay is None else started + delay
+        self._budgets[idx].record_call()
+        self._start_attempt(idx, 0, messages, stop, kwargs, out, cancelled[0])
+        running, winner, hedged = {0}, None, False
+        try:
+            while winner is None:
+                now = time.monotonic()
+                wake = first_token_deadline if hedge_at is None else min(hedge_at, first_token_deadline)
+                try:
+                    attempt, kind, payload = out.get(timeout=max(0.0, wake - now))
+                except queue.Empty:
+                    if hedge_at is not None and time.monotonic() >= hedge_at:
+                        if self._can_hedge(idx):
+                            logger.info(f"Hedging {self._name(idx)} after {hedge_at - started:.2f}s without a token")
+                            self._start_attempt(idx, 1, messages, stop, kwargs, out, cancelled[1])
+                            running.add(1)
+                            hedged = True
+                        hedge_at = None
+                        continue
+                    raise ModelTimeoutError(f"no first token from {self._name(idx)} within "
+                                            f"{first_token_deadline - started:.1f}s")
+                if kind == "error":
+                    running.discard(attempt)
+                    if not running and (hedge_at is None or not self._can_hedge(idx)):
+                        raise payload
+                    if not running:
+                        # The first attempt failed before the hedge was sent; retry straight away
+                        self._start_attempt(idx, 1, messages, stop, kwargs, out, cancelled[1])
+                        running.add(1)
+                        hedge_at, hedged = None, True
+                    continue
+                winner = attempt
+                for other in running - {attempt}:
+                    cancelled[other].set()
+                self._succeeded(idx, time.monotonic() - started, hedged=hedged, winner=attempt)
+                if kind == "chunk":
+                    yield payload
+                else:
+                    return
+            while True:
+                timeout = deadline - time.monotonic()
+                try:
+                    attempt, kind, payload = out.get(timeout=max(0.0, timeout))
+                except queue.Empty:
+                    raise ModelTimeoutError(f"{self._name(idx)} did not finish within the {self.deadline:.0f}s deadline")
+                if attempt != winner:
+                    continue
+                if kind == "chunk":
+                    yield payload
+                elif kind == "end":
+                    return
+                else:
+                    raise payload
+        finally:
+            for event in cancelled:
+                event.set()
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        deadline = time.monotonic() + self.deadline
+        errors: List[Tuple[str, BaseException]] = []
+        for idx in self._order():
+            streamed = False
+            try:
+                with span("model", self._name(idx)):
+                    for chunk in self._stream_tier(idx, messages, stop, kwargs, deadline):
+                        streamed = True
+                        if run_manager:
+                            run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+                        yield ChatGenerationChunk(message=chunk)
+                    if not streamed:
+                        raise EmptyResponseError(f"{self._name(idx)} finished without any output")
+                return
+            except Exception as e:
+                self._failed(idx, e)
+                if streamed:
+                    # Tokens were already shown; a second model can't continue someone else's answer
+                    raise
+                errors.append((self._name(idx), e))
+        raise errors[-1][1]
+
+    # Async path: the same race with tasks, so the loser's HTTP request is actually cancelled
+
+    async def _astream_tier(self, idx: int, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict,
+                            deadline: float) -> AsyncIterator[AIMessageChunk]:
+        loop = asyncio.get_running_loop()
+        out: asyncio.Queue = asyncio.Queue()
+
+        async def pump(attempt: int) -> None:
+            try:
+                async for chunk in self.tiers[idx].astream(messages, config={"callbacks": []}, stop=stop, **kwargs):
+                    await out.put((attempt, "chunk", chunk))
+                await out.put((attempt, "end", None))
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                await out.put((attempt, "error", e))
+
+        started = loop.time()
+        first_token_deadline = min(started + self.first_token_timeout, deadline)
+        delay = self.hedge_delay(idx)
+        hedge_at = None if delay is None else started + delay
+        self._budgets[idx].record_call()
+        tasks = {0: asyncio.ensure_future(pump(0))}
+        running, winner = {0}, None
+        try:
+            while winner is None:
+                wake = first_token_deadline if hedge_at is None else min(hedge_at, first_token_deadline)
+                try:
+                    attempt, kind, payload = await asyncio.wait_for(out.get(), timeout=max(0.0, wake - loop.time()))
+                except asyncio.TimeoutError:
+                    if hedge_at is not None and loop.time() >= hedge_at:
+                        if self._can_hedge(idx):
+                            logger.info(f"Hedging {self._name(idx)} after {hedge_at - started:.2f}s without a token")
+                            tasks[1] = asyncio.ensure_future(pump(1))
+                            running.add(1)
+                        hedge_at = None
+                        continue
+                    raise ModelTimeoutError(f"no first token from {self._name(idx)} within "
+                                            f"{first_token_deadline - started:.1f}s")
+                if kind == "error":
+                    running.discard(attempt)
+                    if not running and (hedge_at is None or not self._can_hedge(idx)):
+                        raise payload
+                    if not running:
+                        tasks[1] = asyncio.ensure_future(pump(1))
+                        running.add(1)
+                        hedge_at = None
+                    continue
+                winner = attempt
+                for other in running - {attempt}:
+                    tasks[other].cancel()
+                self._succeeded(idx, loop.time() - started, hedged=1 in tasks, winner=attempt)
+                if kind == "chunk":
+                    yield payload
+                else:
+                    return
+            while True:
+                try:
+                    attempt, kind, payload = await asyncio.wait_for(out.get(), timeout=max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    raise ModelTimeoutError(f"{self._name(idx)} did not finish within the {self.deadline:.0f}s deadline")
+                if attempt != winner:
+                    continue
+                if kind == "chunk":
+                    yield payload
+                elif kind == "end":
+                    return
+                else:
+                    raise payload
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        deadline = asyncio.get_running_loop().time() + self.deadline
+        errors: List[Tuple[str, BaseException]] = []
+        for idx in self._order():
+            streamed = False
+            try:
+                with span("model", self._name(idx)):
+                    async for chunk in self._astream_tier(idx, messages, stop, kwargs, deadline):
+                        streamed = True
+                        if run_manager:
+                            await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+                        yield ChatGenerationChunk(message=chunk)
+                    if not streamed:
+                        raise EmptyResponseError(f"{self._name(idx)} finished without any output")
+                return
+            except Exception as e:
+                self._failed(idx, e)
+                if streamed:
+                    raise
+                errors.append((self._name(idx), e))
+        raise errors[-1][1]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = None
+        for chunk in self._stream(messages, stop, run_manager, **kwargs):
+            message = chunk.message if message is None else message + chunk.message
+        return ChatResult(generations=[ChatGeneration(message=chunks_to_message(message))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = None
+        async for chunk in self._astream(messages, stop, run_manager, **kwargs):
+            message = chunk.message if message is None else message + chunk.message
+        return ChatResult(generations=[ChatGeneration(message=chunks_to_message(message))])
+
+    def stats(self) -> Dict[str, Any]:
+        return {self._name(idx): {"circuit": self._breakers[idx].state, "failures": self._breakers[idx].failures,
+                                  "ttft_samples": len(self._latencies[idx]), "hedge_delay": self.hedge_delay(idx),
+                                  **self._budgets[idx].stats()}
+                for idx in range(len(self.tiers))}
+
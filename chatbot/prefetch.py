@@ -0,0 +1,100 @@
+# Guide retrieval started before anyone asks for it, so it is off the critical path of a turn.
+# This only applies to the LLM router (ROUTER=llm): `query_or_respond` starts a search for the raw
+# user message while the model is still deciding on a tool call, and the `retrieve` tool then
+# reuses that search when most of its own query's terms are in the user message, waiting for it
+# if it is still running instead of starting another. The default local router decides without a
+# model call and hands its vector hits to `retrieve` itself, so it has nothing to overlap with.
+# Speculative searches are scoped to the conversation thread that started them, so one student's
+# turn never picks up a search made for someone else.
+import time
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, FrozenSet, Optional, Tuple
+
+from .lexical_index import tokenize
+from .retrieval_cache import normalise_query
+from .tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def term_overlap(query: FrozenSet[str], other: FrozenSet[str]) -> float:
+    """Share of `query`'s own terms found in `other`, so a condensed tool query still matches the full question."""
+    if not query or not other:
+        return 0.0
+    return len(query & other) / len(query)
+
+
+class SpeculativeRetriever():
+    """Runs `search` in a small thread pool and hands out the results to matching queries.
+
+    Args:
+        search: Function from a query to the `retrieve` tool's (content, artifact) result.
+        min_overlap: Minimum `term_overlap` of a tool query with a speculative one to reuse its result.
+        ttl: Seconds a speculative search stays available for reuse.
+    """
+
+    def __init__(self, search: Callable[[str], Tuple[str, Any]], workers: int = 2, min_overlap: float = 0.6,
+                 ttl: float = 60.0, max_entries: int = 64):
+        self.search = search
+        self.min_overlap = min_overlap
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.submitted = 0
+        self.hits = 0
+        self.misses = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        # (scope, normalised query) -> (terms, started, future)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[FrozenSet[str], float, Future]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        for key in [key for key, (_, started, _) in self._entries.items() if now - started > self.ttl]:
+            self._entries.pop(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def submit(self, query: str, scope: str) -> Future:
+        """Start searching for `query` in `scope` (a thread ID) unless the same search is already running or fresh."""
+        key = (scope, normalise_query(query))
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry[2]
+            # Run in the caller's context so spans land in the current turn's trace
+            future = self._pool.submit(contextvars.copy_context().run, self.search, query)
+            self._entries[key] = (frozenset(tokenize(query)), now, future)
+            self.submitted += 1
+        metrics.increment("chatbot_speculative_retrieval_total", result="submitted")
+        return future
+
+    def match(self, query: str, scope: str) -> Optional[Future]:
+        """The speculative search in `scope` covering most of `query`'s terms, if one covers enough."""
+        terms = frozenset(tokenize(query))
+        with self._lock:
+            self._expire(time.monotonic())
+            if not self._entries:
+                return None
+            best, best_overlap = None, self.min_overlap
+            for (entry_scope, _), (entry_terms, _, future) in self._entries.items():
+                if entry_scope != scope:
+                    continue
+                overlap = term_overlap(terms, entry_terms)
+                if overlap >= best_overlap and not (future.done() and future.exception() is not None):
+                    best, best_overlap = future, overlap
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.increment("chatbot_speculative_retrieval_total", result="miss" if best is None else "hit")
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"entries": len(self._entries), "submitted": self.submitted, "hits": self.hits,
+                "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
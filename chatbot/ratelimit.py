@@ -0,0 +1,73 @@
+import time
+import threading
+from typing import Optional
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+from .tracing import record_rate_limit_wait
+
+
+class TokenBucket():
+    """Thread-safe token bucket: `rate` tokens per second refill, up to `capacity` tokens of burst.
+
+    `pause()` blocks the whole bucket for a while, e.g. when the upstream API answers 429 with a
+    Retry-After header, so every caller backs off together instead of hammering the API.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> float:
+        """Block until `tokens` are available. Returns the seconds spent waiting.
+
+        Raises TimeoutError if that would take longer than `timeout`.
+        """
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return now - start
+                wait = max(self._paused_until - now, (tokens - self._tokens) / self.rate)
+            if timeout is not None and now - start + wait > timeout:
+                raise TimeoutError(f"Rate limiter wait of {wait:.2f}s exceeds timeout")
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class TracedRateLimiter(InMemoryRateLimiter):
+    """InMemoryRateLimiter that records how long each model call waited for a slot."""
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        start = time.perf_counter()
+        acquired = super().acquire(blocking=blocking)
+        record_rate_limit_wait("llm", time.perf_counter() - start)
+        return acquired
+
+    def has_capacity(self) -> bool:
+        """Whether a request could go ahead right now, without consuming a token."""
+        with self._consume_lock:
+            now = time.monotonic()
+            elapsed = 0.0 if self.last is None else now - self.last
+            return min(self.available_tokens + elapsed * self.requests_per_second, self.max_bucket_size) >= 1
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        start = time.perf_counter()
+        acquired = await super().aacquire(blocking=blocking)
+        record_rate_limit_wait("llm", time.perf_counter() - start)
+        return acquired
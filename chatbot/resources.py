@@ -0,0 +1,243 @@
+# Process-wide clients and the compiled graph, shared by every session.
+# Everything is built lazily on first use and cached with st.cache_resource,
+# so Streamlit reruns and page switches reuse the same objects.
+import logging
+import threading
+from typing import Dict, Optional
+
+import streamlit as st
+
+from .settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+
+@st.cache_resource(show_spinner=False)
+def get_rate_limiter():
+    from .ratelimit import TracedRateLimiter
+    return TracedRateLimiter(
+        requests_per_second=get_setting("LLM_REQUESTS_PER_SECOND", 1.0),
+        check_every_n_seconds=0.5,  # Wake up every 500 ms to check whether allowed to make a request,
+        max_bucket_size=10,  # Controls the maximum burst size.
+    )
+
+
+def build_chat_model(name: str, primary: bool = True):
+    # CHAT_BACKEND=fake streams canned answers with simulated latency, for benchmarks and offline runs
+    if get_setting("CHAT_BACKEND", "mistral") == "fake":
+        from .fake_models import FakeChatModel
+        return FakeChatModel(latency=get_setting("FAKE_CHAT_LATENCY", 0.3),
+                             latency_jitter=get_setting("FAKE_CHAT_LATENCY_JITTER", 0.0),
+                             tokens_per_second=get_setting("FAKE_CHAT_TOKENS_PER_SECOND", 50.0),
+                             answer_words=get_setting("FAKE_CHAT_ANSWER_WORDS", 60),
+                             failure_rate=get_setting("FAKE_CHAT_FAILURE_RATE", 0.0) if primary else 0.0,
+                             seed=get_setting("FAKE_CHAT_SEED", 0), model=name,
+                             rate_limiter=get_rate_limiter())
+    from langchain_mistralai import ChatMistralAI
+    return ChatMistralAI(model=name, api_key=get_setting("MISTRAL_API_KEY"), rate_limiter=get_rate_limiter(),
+                         temperature=get_setting("CHAT_TEMPERATURE", 0.63))
+
+
+@st.cache_resource(show_spinner=False)
+def get_chat_model():
+    """The primary chat model, behind hedging, deadlines and failover to CHAT_FALLBACK_MODELS (comma-separated).
+    MODEL_ROUTER=false returns the bare primary model."""
+    default = "fake-chat" if get_setting("CHAT_BACKEND", "mistral") == "fake" else "ministral-8b-latest"
+    names = [get_setting("CHAT_MODEL", default)]
+    names += [name.strip() for name in get_setting("CHAT_FALLBACK_MODELS", "").split(",") if name.strip()]
+    tiers = [build_chat_model(name, primary=idx == 0) for idx, name in enumerate(names)]
+    if not get_setting("MODEL_ROUTER", True):
+        return tiers[0]
+    from .model_router import RoutedChatModel
+    return RoutedChatModel(tiers=tiers,
+                           first_token_timeout=get_setting("MODEL_FIRST_TOKEN_TIMEOUT", 30.0),
+                           deadline=get_setting("MODEL_DEADLINE", 120.0),
+                           hedge=get_setting("MODEL_HEDGE", True),
+                           hedge_quantile=get_setting("MODEL_HEDGE_QUANTILE", 0.95),
+                           hedge_initial=get_setting("MODEL_HEDGE_INITIAL", 3.0),
+                           hedge_min_delay=get_setting("MODEL_HEDGE_MIN_DELAY", 0.2),
+                           hedge_budget=get_setting("MODEL_HEDGE_BUDGET", 0.1),
+                           failure_threshold=get_setting("MODEL_CIRCUIT_FAILURES", 5),
+                           reset_timeout=get_setting("MODEL_CIRCUIT_RESET", 30.0))
+
+
+@st.cache_resource(show_spinner=False)
+def get_embeddings():
+    # EMBEDDINGS_BACKEND=stub gives a deterministic offline embedder for tests and benchmarks
+    if get_setting("EMBEDDINGS_BACKEND", "mistral") == "stub":
+        from .local_index import StubEmbeddings
+        return StubEmbeddings()
+    from .embedding import MistralAIEmbeddingsWithPause
+    embed = MistralAIEmbeddingsWithPause(api_key=get_setting("MISTRAL_EMBED_API_KEY"),
+                                         max_concurrency=get_setting("EMBED_MAX_CONCURRENCY", 4),
+                                         requests_per_second=get_setting("EMBED_REQUESTS_PER_SECOND", 1.0),
+                                         burst=get_setting("EMBED_BURST", 2))
+    # Set EMBEDDING_CACHE_PATH to an empty string to disable the persistent cache
+    cache_path = get_setting("EMBEDDING_CACHE_PATH", "./data/embedding_cache.sqlite")
+    if not cache_path:
+        return embed
+    from .embedding_cache import CachedEmbeddings
+    return CachedEmbeddings(embed, cache_path, max_entries=get_setting("EMBEDDING_CACHE_MAX_ENTRIES", 100_000))
+
+
+@st.cache_resource(show_spinner=False)
+def get_pinecone_index():
+    from pinecone import Pinecone
+    pc = Pinecone(api_key=get_setting("PINECONE_API_KEY"))
+    return pc.Index(name=get_setting("PINECONE_INDEX", "diircb-lntguides"))
+
+
+@st.cache_resource(show_spinner=False)
+def get_vector_store():
+    # VECTOR_BACKEND=local serves retrieval from an in-process index saved under LOCAL_INDEX_PATH
+    if get_setting("VECTOR_BACKEND", "pinecone") == "local":
+        from .local_index import LocalVectorStore
+        return LocalVectorStore.load(get_setting("LOCAL_INDEX_PATH", "./data/index"), get_embeddings(),
+                                     approximate=get_setting("LOCAL_INDEX_APPROXIMATE", False))
+    from langchain_pinecone import PineconeVectorStore
+    return PineconeVectorStore(embedding=get_embeddings(), index=get_pinecone_index())
+
+
+@st.cache_resource(show_spinner=False)
+def get_chunk_manifest():
+    """Manifest of the chunks in the configured vector index (one per backend)."""
+    from .manifest import ChunkManifest
+    if get_setting("VECTOR_BACKEND", "pinecone") == "local":
+        default_path = f'{get_setting("LOCAL_INDEX_PATH", "./data/index")}/manifest.json'
+    else:
+        default_path = f'./data/manifests/{get_setting("PINECONE_INDEX", "diircb-lntguides")}.json'
+    return ChunkManifest(get_setting("CHUNK_MANIFEST_PATH", default_path))
+
+
+@st.cache_resource(show_spinner=False)
+def get_lexical_index():
+    """BM25 index over the same chunks as the vector index, built at ingest."""
+    from .lexical_index import LexicalIndex
+    if get_setting("VECTOR_BACKEND", "pinecone") == "local":
+        default_path = f'{get_setting("LOCAL_INDEX_PATH", "./data/index")}/lexical'
+    else:
+        default_path = f'./data/lexical/{get_setting("PINECONE_INDEX", "diircb-lntguides")}'
+    return LexicalIndex.load(get_setting("LEXICAL_INDEX_PATH", default_path))
+
+
+@st.cache_resource(show_spinner=False)
+def get_retrieval_cache():
+    from .retrieval_cache import RetrievalCache
+    return RetrievalCache(max_entries=get_setting("RETRIEVAL_CACHE_SIZE", 256),
+                          ttl=get_setting("RETRIEVAL_CACHE_TTL", 3600.0),
+                          similarity_threshold=get_setting("RETRIEVAL_CACHE_THRESHOLD", 0.95))
+
+
+@st.cache_resource(show_spinner=False)
+def get_speculative_retriever():
+    from .graph import search_guides
+    from .prefetch import SpeculativeRetriever
+    return SpeculativeRetriever(search_guides, workers=get_setting("PREFETCH_WORKERS", 2),
+                                min_overlap=get_setting("SPECULATIVE_MIN_OVERLAP", 0.6),
+                                ttl=get_setting("SPECULATIVE_TTL", 60.0))
+
+
+@st.cache_resource(show_spinner=False)
+def get_answer_cache():
+    from .answer_cache import AnswerCache
+    return AnswerCache(max_entries=get_setting("ANSWER_CACHE_SIZE", 512),
+                       ttl=get_setting("ANSWER_CACHE_TTL", 24 * 3600.0),
+                       similarity_threshold=get_setting("ANSWER_CACHE_THRESHOLD", 0.92))
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_stage_evaluator(caseNum: int, version: str, _case):
+    """Grading material for a case, precomputed once per version of its file (`_case` is not hashed)."""
+    from .evaluation import StageEvaluator
+    return StageEvaluator(_case, get_embeddings())
+
+
+@st.cache_resource(show_spinner=False)
+def get_graph():
+    from .graph import build_graph
+    from .threads import delete_thread, thread_registry
+    graph = build_graph()
+    thread_registry.on_expire = lambda thread_id: delete_thread(graph.checkpointer, thread_id)
+    # A thread whose checkpoints were evicted must not be resumed with an empty, unseeded history
+    graph.checkpointer.on_evict = thread_registry.expire
+    return graph
+
+
+@st.cache_resource(show_spinner=False)
+def get_executor():
+    from .executor import GraphExecutor
+    return GraphExecutor(max_concurrency=get_setting("EXECUTOR_MAX_CONCURRENCY", 8),
+                         max_queue=get_setting("EXECUTOR_MAX_QUEUE", 64),
+                         max_per_session=get_setting("EXECUTOR_MAX_PER_SESSION", 2))
+
+
+@st.cache_resource(show_spinner=False)
+def get_metrics_server():
+    """Prometheus endpoint on METRICS_HOST:METRICS_PORT; not started when the port is 0 (the default)."""
+    port = get_setting("METRICS_PORT", 0)
+    if not port:
+        return None
+    from .tracing import start_metrics_server
+    return start_metrics_server(port, host=get_setting("METRICS_HOST", "127.0.0.1"))
+
+
+RESOURCES = {
+    "rate_limiter": get_rate_limiter,
+    "chat_model": get_chat_model,
+    "embeddings": get_embeddings,
+    "pinecone_index": get_pinecone_index,
+    "vector_store": get_vector_store,
+    "chunk_manifest": get_chunk_manifest,
+    "lexical_index": get_lexical_index,
+    "retrieval_cache": get_retrieval_cache,
+    "answer_cache": get_answer_cache,
+    "speculative_retriever": get_speculative_retriever,
+    "graph": get_graph,
+    "executor": get_executor,
+}
+
+
+def notify_index_changed() -> None:
+    """Call after documents are added to or removed from the vector index."""
+    get_retrieval_cache().invalidate()
+    get_answer_cache().invalidate()
+
+
+def check_health() -> Dict[str, str]:
+    """Build (if needed) and probe each resource. Returns "ok" or the error message per resource."""
+    status = {}
+    for name, getter in RESOURCES.items():
+        if name == "pinecone_index" and get_setting("VECTOR_BACKEND", "pinecone") != "pinecone":
+            continue
+        try:
+            resource = getter()
+            if name == "pinecone_index":
+                resource.describe_index_stats()
+            status[name] = "ok"
+        except Exception as e:
+            logger.error(f"Health check failed for {name}: {e}")
+            status[name] = str(e)
+    return status
+
+
+def reset(name: Optional[str] = None) -> None:
+    """Drop one cached resource (or all of them) so it is rebuilt on next use."""
+    getters = RESOURCES.values() if name is None else [RESOURCES[name]]
+    for getter in getters:
+        getter.clear()
+
+
+@st.cache_resource(show_spinner=False)
+def warm_up() -> threading.Thread:
+    """Construct the API clients in the background so the first render doesn't wait for them.
+    Cached, so the thread is only started once per process."""
+    def _build():
+        for name in ("chat_model", "vector_store"):
+            try:
+                RESOURCES[name]()
+            except Exception as e:
+                logger.error(f"Failed to warm up {name}: {e}")
+    get_metrics_server()
+    thread = threading.Thread(target=_build, name="resource-warm-up", daemon=True)
+    thread.start()
+    return thread
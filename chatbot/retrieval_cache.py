@@ -0,0 +1,96 @@
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .vectors import unit_vectors
+
+logger = logging.getLogger(__name__)
+
+
+def normalise_query(query: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivially different queries match."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+class RetrievalCache():
+    """Two-tier cache for `retrieve` results.
+
+    Tier 1 matches on the normalised query text and needs no embedding. Tier 2 compares the query
+    embedding against cached queries and returns the closest entry whose cosine similarity is at
+    least `similarity_threshold`. Entries are evicted LRU beyond `max_entries` and expire after `ttl`
+    seconds. `invalidate()` must be called whenever the index is re-embedded.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        # normalised query -> (stored_at, unit embedding or None, artifact)
+        self._entries: "OrderedDict[str, Tuple[float, Optional[np.ndarray], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expired(self, stored_at: float) -> bool:
+        return time.monotonic() - stored_at > self.ttl
+
+    def get_exact(self, query: str) -> Optional[Any]:
+        key = normalise_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[0]):
+                return None
+            self._entries.move_to_end(key)
+            self.hits_exact += 1
+            return entry[2]
+
+    def get_similar(self, embedding: List[float]) -> Optional[Any]:
+        """Closest cached entry by cosine similarity, or None (counted as a miss)."""
+        query = unit_vectors(embedding)
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            for key, (stored_at, cached, _) in self._entries.items():
+                if cached is None or self._expired(stored_at):
+                    continue
+                score = float(cached @ query)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits_semantic += 1
+            return self._entries[best_key][2]
+
+    def put(self, query: str, embedding: Optional[List[float]], artifact: Any) -> None:
+        key = normalise_query(query)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), None if embedding is None else unit_vectors(embedding), artifact)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        logger.info("Retrieval cache invalidated")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits_exact + self.hits_semantic + self.misses
+        return {
+            "entries": len(self),
+            "hits_exact": self.hits_exact,
+            "hits_semantic": self.hits_semantic,
+            "misses": self.misses,
+            "hit_rate": (self.hits_exact + self.hits_semantic) / lookups if lookups else 0.0,
+        }
+
@@ -0,0 +1,105 @@
+# Local retrieve-vs-respond routing for free-text questions (ROUTER=local, the default).
+# Instead of a tool-calling model call deciding whether to use `retrieve`, the question is compared
+# with the indexed corpus: first by how many of its terms the BM25 vocabulary knows (no network
+# call at all), then, if that is inconclusive, by the cosine similarity of its embedding to the
+# closest chunk. Questions about the guides go straight to `retrieve` -> `generate`; anything else
+# gets a single direct answer. Every decision is logged as JSON on the `chatbot.router` logger with
+# its scores, so the thresholds can be tuned offline from the logs.
+# Follow-ups such as "and where should its tip be?" say little on their own, so short questions and
+# questions that refer back are routed (and searched) together with the previous question. When the
+# vector index was searched to route, its hits are returned so `retrieve` does not search again.
+import re
+import json
+import logging
+from dataclasses import dataclass, field, fields
+from typing import Any, List, Optional, Tuple
+
+from .lexical_index import tokenize
+from .resources import get_embeddings, get_lexical_index, get_vector_store
+from .settings import get_setting
+from .tracing import metrics, span
+
+logger = logging.getLogger(__name__)
+decision_logger = logging.getLogger("chatbot.router")
+
+# Words that point back at an earlier question
+REFERENTS = frozenset("it its this that these those they them their one ones".split())
+# Enough vector hits for `search_guides` to fuse with BM25 results, so routing hits can be reused
+ROUTE_FETCH_K = 10
+
+
+@dataclass
+class RouteDecision():
+    route: str  # "retrieve" or "respond"
+    reason: str
+    terms: int = 0
+    lexical_coverage: Optional[float] = None
+    vector_score: Optional[float] = None
+    # Query embedding and (document, score) hits when the vector index was searched
+    embedding: Optional[List[float]] = field(default=None, repr=False)
+    hits: Optional[List[Tuple[Any, float]]] = field(default=None, repr=False)
+
+    def log_fields(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name not in ("embedding", "hits")}
+
+
+def condense_query(messages: List[Any], min_terms: int = 4) -> str:
+    """The latest question, prefixed with the previous free-text question when it is a short or referring follow-up."""
+    question = str(messages[-1].content)
+    if len(tokenize(question)) >= min_terms and not REFERENTS & set(re.findall(r"[a-z]+", question.lower())):
+        return question
+    for message in reversed(messages[:-1]):
+        if message.type != "human":
+            continue
+        # A stage submission starts a new topic; there is nothing to fold in before it
+        if message.additional_kwargs.get("stage") is not None:
+            break
+        return f"{message.content}\n{question}"
+    return question
+
+
+def lexical_coverage(query: str) -> Optional[float]:
+    """Share of the query's content terms found in the BM25 vocabulary, or None without an index."""
+    index = get_lexical_index()
+    return index.term_coverage(query) if len(index) else None
+
+
+def vector_hits(query: str, k: int = ROUTE_FETCH_K) -> Tuple[List[float], List[Tuple[Any, float]]]:
+    """The query's embedding and its `k` closest indexed chunks with their cosine similarities."""
+    embedding = get_embeddings().embed_query(query)
+    return embedding, get_vector_store().similarity_search_by_vector_with_score(embedding, k=k)
+
+
+def decide(query: str, lexical_threshold: float, vector_threshold: float) -> RouteDecision:
+    terms = len(tokenize(query))
+    if not terms:
+        # Only stopwords and punctuation, e.g. "what do you do?"
+        return RouteDecision("respond", "no_terms", terms)
+    coverage = lexical_coverage(query)
+    if coverage is not None and coverage >= lexical_threshold:
+        return RouteDecision("retrieve", "lexical", terms, lexical_coverage=coverage)
+    try:
+        embedding, hits = vector_hits(query)
+    except Exception as e:
+        # Retrieving when unsure costs one model call, answering without the guides costs accuracy
+        logger.error(f"Router could not score the query, retrieving: {e}")
+        return RouteDecision("retrieve", "error", terms, lexical_coverage=coverage)
+    score = float(hits[0][1]) if hits else 0.0
+    route = "retrieve" if score >= vector_threshold else "respond"
+    return RouteDecision(route, "vector", terms, lexical_coverage=coverage, vector_score=score,
+                         embedding=embedding, hits=hits)
+
+
+def route_query(query: str) -> RouteDecision:
+    """Decide whether `query` needs the guides, without calling the chat model."""
+    lexical_threshold = get_setting("ROUTER_LEXICAL_THRESHOLD", 0.6)
+    vector_threshold = get_setting("ROUTER_VECTOR_THRESHOLD", 0.75)
+    with span("routing", "route_query") as attributes:
+        decision = decide(query, lexical_threshold, vector_threshold)
+        attributes.update(route=decision.route, reason=decision.reason)
+    metrics.increment("chatbot_router_total", route=decision.route, reason=decision.reason)
+    if decision.vector_score is not None:
+        metrics.observe("chatbot_router_vector_score", decision.vector_score)
+    decision_logger.info(json.dumps({"query": query, **decision.log_fields(), "lexical_threshold": lexical_threshold,
+                                     "vector_threshold": vector_threshold}))
+    return decision
@@ -0,0 +1,24 @@
+import os
+from typing import Any
+
+import streamlit as st
+
+
+def get_setting(name: str, default: Any = None) -> Any:
+    """Read a setting from the environment, then Streamlit secrets, then fall back to `default`.
+
+    Values read from the environment are strings; they are cast to the type of
+    `default` when one is given so `get_setting("X", 10)` returns an int.
+    """
+    if name in os.environ:
+        value = os.environ[name]
+    else:
+        try:
+            return st.secrets[name]
+        except (KeyError, FileNotFoundError):
+            return default
+    if default is None or isinstance(value, type(default)):
+        return value
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return type(default)(value)
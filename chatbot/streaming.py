@@ -0,0 +1,92 @@
+# Adapter between graph.stream(..., stream_mode="messages") and st.write_stream.
+# Streamlit re-renders the message on every yielded string, so tokens are coalesced into flushes
+# of at least `flush_chars` characters or `flush_interval` seconds. The first token is flushed
+# straight away so the student sees the answer start as early as possible.
+import time
+import logging
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk, message_chunk_to_message
+
+from .settings import get_setting
+from .tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+# Graph nodes whose model output is shown to the student
+STREAMED_NODES = frozenset({"query_or_respond", "respond", "generate", "evaluate_stage"})
+
+
+class EmptyResponseError(RuntimeError):
+    pass
+
+
+def chunks_to_message(chunk: Optional[AIMessageChunk]) -> AIMessage:
+    """Streamed chunks (already added together) as one message, keeping response metadata and usage."""
+    if chunk is None:
+        raise EmptyResponseError("chat model finished without any output")
+    return message_chunk_to_message(chunk)
+
+
+@dataclass
+class StreamStats():
+    started: float
+    first_token: Optional[float] = None
+    finished: Optional[float] = None
+    tokens: int = 0
+    flushes: int = 0
+
+    @property
+    def ttft(self) -> Optional[float]:
+        return None if self.first_token is None else self.first_token - self.started
+
+    @property
+    def tokens_per_second(self) -> float:
+        if self.first_token is None or self.finished is None or self.finished <= self.first_token:
+            return 0.0
+        return self.tokens / (self.finished - self.first_token)
+
+
+def coalesce_stream(chunks: Iterable[Tuple[object, dict]], stats: Optional[StreamStats] = None,
+                    flush_interval: Optional[float] = None, flush_chars: Optional[int] = None) -> Iterator[str]:
+    """Yield the text of streamed AI message chunks, coalesced into UI-sized flushes.
+
+    Args:
+        chunks: `(message_chunk, metadata)` tuples from `graph.stream(..., stream_mode="messages")`.
+        stats: Filled in with time-to-first-token, token count and throughput.
+    """
+    flush_interval = flush_interval if flush_interval is not None else get_setting("STREAM_FLUSH_INTERVAL", 0.03)
+    flush_chars = flush_chars if flush_chars is not None else get_setting("STREAM_FLUSH_CHARS", 64)
+    stats = stats or StreamStats(started=time.perf_counter())
+    buffer = []
+    size = 0
+    last_flush = stats.started
+    for message, metadata in chunks:
+        # Tool-call chunks and ToolMessages carry no text for the student
+        if type(message) is not AIMessageChunk or message.tool_call_chunks or not message.content:
+            continue
+        if metadata.get("langgraph_node") not in STREAMED_NODES:
+            continue
+        text = message.content if isinstance(message.content, str) else "".join(
+            part.get("text", "") for part in message.content if isinstance(part, dict))
+        now = time.perf_counter()
+        stats.tokens += 1
+        buffer.append(text)
+        size += len(text)
+        if stats.first_token is None:
+            stats.first_token = now
+        elif size < flush_chars and now - last_flush < flush_interval:
+            continue
+        stats.flushes += 1
+        yield "".join(buffer)
+        buffer, size, last_flush = [], 0, now
+    if buffer:
+        stats.flushes += 1
+        yield "".join(buffer)
+    stats.finished = time.perf_counter()
+    if stats.ttft is not None:
+        metrics.observe("chatbot_ttft_seconds", stats.ttft, backend="langgraph")
+        metrics.observe("chatbot_stream_tokens_per_second", stats.tokens_per_second)
+        logger.info(f"Streamed {stats.tokens} tokens in {stats.flushes} flushes, "
+                    f"TTFT {stats.ttft:.3f}s, {stats.tokens_per_second:.1f} tokens/s")
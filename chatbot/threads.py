@@ -0,0 +1,133 @@
+import time
+import uuid
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.messages import SystemMessage
+
+logger = logging.getLogger(__name__)
+
+SYSPROMPT_PATH = "./data/prompts/sysprompt.txt"
+
+
+@dataclass
+class ConversationThread():
+    thread_id: str
+    created_at: float
+    last_active: float
+
+    @property
+    def config(self) -> dict:
+        """LangGraph run config pointing at this thread's checkpoints."""
+        return {"configurable": {"thread_id": self.thread_id}}
+
+
+class ThreadRegistry():
+    """Creates, looks up and expires one conversation thread per browser session.
+
+    Threads idle for longer than `idle_ttl` seconds are expired lazily whenever a
+    new thread is created; `on_expire` is called with the expired thread ID so the
+    owner of the checkpointer can drop that thread's checkpoints.
+    """
+
+    def __init__(self, idle_ttl: float = 3600.0, on_expire: Optional[Callable[[str], None]] = None):
+        self.idle_ttl = idle_ttl
+        self.on_expire = on_expire
+        self._threads: Dict[str, ConversationThread] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+    def create(self) -> ConversationThread:
+        self.expire_idle()
+        now = time.monotonic()
+        thread = ConversationThread(thread_id=uuid.uuid4().hex, created_at=now, last_active=now)
+        with self._lock:
+            self._threads[thread.thread_id] = thread
+        logger.info(f"Created conversation thread {thread.thread_id} ({len(self)} active)")
+        return thread
+
+    def adopt(self, thread_id: str) -> ConversationThread:
+        """Register an existing thread, e.g. one restored from an on-disk checkpointer after a restart."""
+        now = time.monotonic()
+        with self._lock:
+            thread = self._threads.setdefault(thread_id, ConversationThread(thread_id, now, now))
+            thread.last_active = now
+        return thread
+
+    def get(self, thread_id: Optional[str]) -> Optional[ConversationThread]:
+        """Look up a live thread and mark it as active. Returns None if unknown or expired."""
+        if thread_id is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            thread = self._threads.get(thread_id)
+            if thread is None:
+                return None
+            if now - thread.last_active > self.idle_ttl:
+                expired = True
+            else:
+                thread.last_active = now
+                expired = False
+        if expired:
+            self.expire(thread_id)
+            return None
+        return thread
+
+    def expire(self, thread_id: str) -> None:
+        with self._lock:
+            thread = self._threads.pop(thread_id, None)
+        if thread is None:
+            return
+        logger.info(f"Expired conversation thread {thread_id}")
+        if self.on_expire is not None:
+            try:
+                self.on_expire(thread_id)
+            except Exception as e:
+                logger.error(f"Failed to clean up thread {thread_id}: {e}")
+
+    def expire_idle(self) -> List[str]:
+        cutoff = time.monotonic() - self.idle_ttl
+        with self._lock:
+            idle = [tid for tid, thread in self._threads.items() if thread.last_active < cutoff]
+        for thread_id in idle:
+            self.expire(thread_id)
+        return idle
+
+
+def delete_thread(checkpointer, thread_id: str) -> None:
+    """Drop every checkpoint and pending write stored for `thread_id`."""
+    if hasattr(checkpointer, "delete_thread"):
+        checkpointer.delete_thread(thread_id)
+        return
+    # MemorySaver keeps checkpoints per thread and writes keyed by (thread_id, ns, checkpoint_id)
+    checkpointer.storage.pop(thread_id, None)
+    for key in [key for key in checkpointer.writes if key[0] == thread_id]:
+        checkpointer.writes.pop(key, None)
+
+
+def load_system_prompt(path: str = SYSPROMPT_PATH) -> str:
+    with open(path, "r") as f:
+        return f.read()
+
+
+def start_thread(graph, registry: ThreadRegistry) -> ConversationThread:
+    """Create a new thread and seed its checkpoint with the system prompt."""
+    thread = registry.create()
+    graph.update_state(config=thread.config, values={"messages": [SystemMessage(load_system_prompt())]})
+    return thread
+
+
+def resume_thread(graph, registry: ThreadRegistry, thread_id: Optional[str]) -> Optional[ConversationThread]:
+    """Re-attach to a thread that still has checkpoints, or return None if there is nothing to resume."""
+    if not thread_id:
+        return None
+    if not graph.get_state({"configurable": {"thread_id": thread_id}}).values.get("messages"):
+        return None
+    return registry.adopt(thread_id)
+
+
+thread_registry = ThreadRegistry()
@@ -0,0 +1,354 @@
+# Per-turn latency tracing and process-wide metrics.
+# Each chat turn gets a Trace holding timed spans for graph nodes, tool calls, model calls,
+# embedding requests, vector searches and rate-limiter waits. Every span is also folded into a
+# sliding-window histogram, so p50/p95 are available to the admin page and, when METRICS_PORT is
+# set, to Prometheus. A finished turn is logged as one JSON record on the `chatbot.trace` logger.
+# Session IDs double as the `?thread=` resume token, so traces only ever carry a hash of them.
+import json
+import hashlib
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("chatbot.trace")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram():
+    """Count and sum of all observations, plus the latest `window` samples for quantiles."""
+
+    def __init__(self, window: int = 2048):
+        self.count = 0
+        self.sum = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)) -> Dict[float, float]:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in qs}
+        return {q: ordered[min(int(len(ordered) * q), len(ordered) - 1)] for q in qs}
+
+
+class MetricsRegistry():
+    """Thread-safe histograms, counters and gauges keyed by metric name and labels."""
+
+    def __init__(self, window: int = 2048, recent_traces: int = 50):
+        self.window = window
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.traces: Deque[Dict[str, Any]] = deque(maxlen=recent_traces)
+        self._lock = threading.Lock()
+
+    def observe(self, metric: str, value: float, **labels: str) -> None:
+        key = (metric, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.window)
+            histogram.observe(value)
+
+    def increment(self, metric: str, value: float = 1.0, **labels: str) -> None:
+        key = (metric, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def set_gauge(self, metric: str, value: float, **labels: str) -> None:
+        key = (metric, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.gauges[key] = value
+
+    def record_trace(self, summary: Dict[str, Any]) -> None:
+        with self._lock:
+            self.traces.append(summary)
+
+    def recent_traces(self) -> List[Dict[str, Any]]:
+        """Finished turn summaries, newest first."""
+        with self._lock:
+            return list(reversed(self.traces))
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Rows for display: one per histogram (count, mean, p50/p95/p99) and one per counter or gauge."""
+        with self._lock:
+            histograms = [(name, labels, h.count, h.sum, h.quantiles()) for (name, labels), h in self.histograms.items()]
+            counters = list(self.counters.items()) + list(self.gauges.items())
+        return {
+            "histograms": [
+                {"metric": name, **dict(labels), "count": count, "mean": total / count if count else 0.0,
+                 "p50": qs[0.5], "p95": qs[0.95], "p99": qs[0.99]}
+                for name, labels, count, total, qs in sorted(histograms)
+            ],
+            "counters": [{"metric": name, **dict(labels), "value": value} for (name, labels), value in sorted(counters)],
+        }
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format; histograms are exported as summaries."""
+        with self._lock:
+            histograms = sorted((key, h.count, h.sum, h.quantiles()) for key, h in self.histograms.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        lines = []
+        typed = set()
+        for (name, labels), count, total, qs in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} summary")
+                typed.add(name)
+            for q, value in qs.items():
+                lines.append(f"{name}{_format_labels(labels + (('quantile', str(q)),))} {value:.6f}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), value in gauges:
+            if name not in typed:
+                lines.append(f"# TYPE {name} gauge")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.traces.clear()
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+metrics = MetricsRegistry()
+
+
+@dataclass
+class Span():
+    kind: str
+    name: str
+    start: float
+    duration: float = 0.0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+
+class Trace():
+    """Spans recorded during one chat turn. Spans may be added from any thread."""
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.session_id = session_id
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        return {
+            "trace_id": self.trace_id,
+            "session_id": anonymise(self.session_id),
+            "duration": round(self.duration, 4),
+            "spans": [{"kind": span.kind, "name": span.name, "offset": round(span.start - self.started, 4),
+                       "duration": round(span.duration, 4), **span.attributes} for span in spans],
+        }
+
+
+def anonymise(session_id: Optional[str]) -> Optional[str]:
+    """Short, stable hash of a session ID that cannot be used to resume its thread."""
+    if session_id is None:
+        return None
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:12]
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("chatbot_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def record_span(kind: str, name: str, start: float, duration: float, **attributes: Any) -> None:
+    """Add a finished span to the histograms and, inside a traced turn, to the turn's trace."""
+    metrics.observe("chatbot_span_seconds", duration, kind=kind, name=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(Span(kind, name, start, duration, attributes))
+    logger.debug(f"{kind}:{name} took {duration * 1000:.1f}ms {attributes or ''}")
+
+
+@contextmanager
+def span(kind: str, name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """Time a block. Yields the span's attributes so the block can add to them (e.g. hit counts)."""
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        record_span(kind, name, start, time.perf_counter() - start, **attributes)
+
+
+def record_rate_limit_wait(limiter: str, wait: float) -> None:
+    metrics.observe("chatbot_rate_limit_wait_seconds", wait, limiter=limiter)
+    trace = _current_trace.get()
+    if trace is not None and wait > 0:
+        trace.add(Span("rate_limit", limiter, time.perf_counter() - wait, wait))
+
+
+@contextmanager
+def trace_turn(session_id: Optional[str] = None) -> Iterator[Trace]:
+    """Collect the spans of one chat turn, then record its latency and log it as JSON."""
+    trace = Trace(session_id)
+    token = _current_trace.set(trace)
+    status = "ok"
+    try:
+        yield trace
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        _current_trace.reset(token)
+        trace.duration = time.perf_counter() - trace.started
+        metrics.observe("chatbot_turn_seconds", trace.duration)
+        metrics.increment("chatbot_turns_total", status=status)
+        summary = {**trace.summary(), "status": status}
+        metrics.record_trace(summary)
+        trace_logger.info(json.dumps(summary, default=str))
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """Turns LangChain/LangGraph callbacks of a turn into spans: graph nodes, tools and model calls.
+
+    Model spans carry time to first token and token usage when the provider reports it.
+    """
+
+    run_inline = True
+
+    def __init__(self, trace: Trace):
+        self.trace = trace
+        self._root: Optional[UUID] = None
+        self._runs: Dict[UUID, Tuple[str, str, float]] = {}
+        self._first_token: Dict[UUID, float] = {}
+
+    def _start(self, run_id: UUID, kind: str, name: str) -> None:
+        self._runs[run_id] = (kind, name, time.perf_counter())
+
+    def _end(self, run_id: UUID, **attributes: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        kind, name, start = run
+        first_token = self._first_token.pop(run_id, None)
+        if first_token is not None:
+            attributes["ttft"] = round(first_token - start, 4)
+            metrics.observe("chatbot_llm_ttft_seconds", first_token - start, model=name)
+        metrics.observe("chatbot_span_seconds", time.perf_counter() - start, kind=kind, name=name)
+        self.trace.add(Span(kind, name, start, time.perf_counter() - start, attributes))
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                       metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        # The graph itself is the root run; its direct children are the node runs
+        if parent_run_id is None:
+            self._root = run_id
+        elif parent_run_id == self._root:
+            node = (metadata or {}).get("langgraph_node", kwargs.get("name", "?"))
+            if not node.startswith("__"):
+                self._start(run_id, "node", node)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=type(error).__name__)
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, "tool", (serialized or {}).get("name") or kwargs.get("name", "tool"))
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=type(error).__name__)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, invocation_params: Optional[dict] = None,
+                            **kwargs: Any) -> None:
+        params = invocation_params or {}
+        self._start(run_id, "llm", params.get("model") or params.get("model_name") or params.get("_type", "llm"))
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if token and run_id not in self._first_token:
+            self._first_token[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        attributes = {}
+        usage = None
+        try:
+            usage = response.generations[0][0].message.usage_metadata
+        except (AttributeError, IndexError):
+            pass
+        if usage:
+            model = self._runs.get(run_id, ("", "llm", 0))[1]
+            attributes = {"input_tokens": usage.get("input_tokens", 0), "output_tokens": usage.get("output_tokens", 0)}
+            metrics.increment("chatbot_llm_tokens_total", attributes["input_tokens"], model=model, type="input")
+            metrics.increment("chatbot_llm_tokens_total", attributes["output_tokens"], model=model, type="output")
+        self._end(run_id, **attributes)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=type(error).__name__)
+
+
+def traced_config(config: dict, trace: Trace) -> dict:
+    """Copy of a graph config with the trace's callback handler attached."""
+    callbacks = list(config.get("callbacks") or [])
+    return {**config, "callbacks": callbacks + [TraceCallbackHandler(trace)]}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format % args)
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve `/metrics` for Prometheus from a daemon thread, on localhost unless `host` says otherwise."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,10 @@
+# Vector helpers shared by the local index, the retrieval and answer caches and stage grading.
+import numpy as np
+from numpy.typing import ArrayLike
+
+
+def unit_vectors(vectors: ArrayLike) -> np.ndarray:
+    """float32 copy of one vector or a matrix of row vectors scaled to unit length; zero vectors stay zero."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
@@ -0,0 +1,68 @@
+import hmac
+
+import streamlit as st
+
+from chatbot.resources import (get_answer_cache, get_chat_model, get_embeddings, get_executor, get_graph, get_retrieval_cache,
+                               get_speculative_retriever)
+from chatbot.settings import get_setting
+from chatbot.tracing import metrics
+from components.imageAssets import getImageAssets
+
+
+def checkAdminPassword() -> bool:
+    """Ask for ADMIN_PASSWORD once per session. The page stays locked when no password is configured."""
+    if st.session_state.get("adminAuthenticated"):
+        return True
+    password = get_setting("ADMIN_PASSWORD", "")
+    if not password:
+        st.error("Set ADMIN_PASSWORD to use the admin page.")
+        return False
+    attempt = st.text_input("Admin password", type="password", key="adminPasswordInput")
+    if attempt and hmac.compare_digest(attempt.encode("utf-8"), str(password).encode("utf-8")):
+        st.session_state.adminAuthenticated = True
+        del st.session_state["adminPasswordInput"]
+        return True
+    if attempt:
+        st.error("Wrong password.")
+    return False
+
+
+def loadAdminPage() -> None:
+    """Latency percentiles, counters and recent turn traces for this server process."""
+    st.title("Admin")
+    if not checkAdminPassword():
+        return
+    col1, col2 = st.columns([0.8, 0.2])
+    with col1:
+        st.caption("Latencies are in seconds, over the most recent samples of each metric.")
+    with col2:
+        st.button("Reset metrics", "resetMetricsBtn", on_click=metrics.reset)
+
+    snapshot = metrics.snapshot()
+    st.subheader("Latency")
+    if snapshot["histograms"]:
+        st.dataframe(snapshot["histograms"], hide_index=True)
+    else:
+        st.write("No turns recorded yet.")
+    st.subheader("Counters and gauges")
+    st.dataframe(snapshot["counters"], hide_index=True)
+
+    st.subheader("Resources")
+    stats = {"executor": get_executor().stats(), "retrieval_cache": get_retrieval_cache().stats(),
+             "answer_cache": get_answer_cache().stats(), "speculative_retrieval": get_speculative_retriever().stats(),
+             "image_cache": getImageAssets().stats()}
+    checkpointer = get_graph().checkpointer
+    if hasattr(checkpointer, "stats"):
+        stats["checkpointer"] = checkpointer.stats()
+    chatModel = get_chat_model()
+    if hasattr(chatModel, "stats"):
+        stats["chat_models"] = chatModel.stats()
+    embeddings = get_embeddings()
+    if hasattr(embeddings, "stats"):
+        stats["embedding_cache"] = embeddings.stats()
+    st.json(stats)
+
+    st.subheader("Recent turns")
+    for trace in metrics.recent_traces():
+        with st.expander(f"{trace['trace_id']} · {trace['duration']:.2f}s · {trace['status']}"):
+            st.dataframe(trace["spans"], hide_index=True)
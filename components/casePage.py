@@ -1,12 +1,17 @@
 import os
 import random
 import time
+import logging
 
 import streamlit as st
 
+from components.imageAssets import getImageAssets
 from components.server import updateConversation
+from components.transcript import Transcript
 from schema.schema import Case
 
+logger = logging.getLogger(__name__)
+
 
 class CasePage():
     def __init__(self, case: Case) -> None:
@@ -44,37 +49,59 @@ class CasePage():
                 st.button("Clear Conversation", "clearConversationBtn", on_click=self.clearConversation)
                 self.chatContainer = st.container(height=520, border=True)
                 self.loadConvoWindow()
-            with self.imagesTab:
-                col1, col2 = st.columns([0.5, 0.5])
-                with col1:
-                    st.image("./data/cases/imgs/cxr-ett-normal.png", caption="Normal ETT", width=512)
-                    st.markdown(
-                        'Benzocaine-Induced Cyanosis - Scientific Figure on ResearchGate. Available from: https://www.researchgate.net/figure/A-chest-x-ray-showing-correct-endotracheal-tube-placement-and-no-acute-lung-pathology_fig2_303797877 [accessed 10 Dec 2024]')
-                with col2:
-                    st.image("./data/cases/imgs/cxr-ett-abnormal.png",
-                             caption=["Abnormal ETT, tip in right main bronchus; Endotracheal tube: red dotted line; Trachea: blue dotted line; Nasogastric tube: yellow dotted line"], width=512)
-                    st.html('Case courtesy of Frank Gaillard, <a href="https://radiopaedia.org/?lang=us">Radiopaedia.org</a>. From the case <a href="https://radiopaedia.org/cases/15330?lang=us">rID: 15330</a>')
+        with self.imagesTab:
+            self.loadImages()
+
+    def loadImages(self) -> None:
+        # Previews come from the shared image cache; full resolution is only sent when toggled on
+        images = self.currentCase.images
+        if not images:
+            st.write("No images for this case yet.")
+            return
+        assets = getImageAssets()
+        columns = st.columns(2)
+        for idx, image in enumerate(images):
+            with columns[idx % 2]:
+                full = st.toggle("Full resolution", key=f"case{self.currentCase.caseNum}Image{idx + 1}Full")
+                if full:
+                    st.image(assets.get(image, "full"), caption=image.caption or None)
+                else:
+                    st.image(assets.get(image, "preview"), caption=image.caption or None, width=512)
+                if image.credit:
+                    st.markdown(image.credit)
 
     def loadScenarioForm(self, caseNum: int, questions: list):
         with st.form(key=f"case{caseNum}Form"):
             for idx, item in enumerate(questions):
-                st.text_area(label=f"Question {idx+1}: {item['question']}", key=f"case{caseNum}Question{idx+1}")
+                st.text_area(label=f"Question {idx+1}: {item.question}", key=f"case{caseNum}Question{idx+1}")
             st.form_submit_button(on_click=self.onSubmitScenarioForm)
         return None
 
+    def transcript(self) -> Transcript:
+        """The conversation to draw; the CustomGPT history is only kept in the session."""
+        return st.session_state.messages
+
     def loadConvoWindow(self) -> None:
+        # Only the latest messages are drawn as bubbles; earlier pages are opened on request
+        transcript = self.transcript()
+        pagesShown = st.session_state.get("pagesShown", 0)
         with self.chatContainer:
-            for message in st.session_state.messages:
-                with st.chat_message(message['role']):
-                    st.markdown(message['content'])
+            if pagesShown < transcript.pageCount:
+                st.button(f"Show earlier messages ({transcript.pageCount - pagesShown} more pages)",
+                          "earlierMessagesBtn", on_click=self.showEarlierMessages)
+            for markdown in transcript.shownPages(pagesShown):
+                st.markdown(markdown)
+                st.divider()
+            for record in transcript.recent():
+                with st.chat_message(record.role):
+                    st.markdown(record.content)
         st.chat_input("Ask me a question", key="chatInput", on_submit=self.onSubmitNewPrompt)
 
+    def showEarlierMessages(self) -> None:
+        st.session_state.pagesShown = st.session_state.get("pagesShown", 0) + 1
+
     def updateChatHistory(self, role: str, content: str) -> None:
-        st.session_state.messages.append({
-            "role": role,
-            "content": content,
-        })
-        # print(f"updated chat history {role}, {content}")
+        st.session_state.messages.append(role, content)
 
     def onSubmitNewPrompt(self) -> None:
         prompt = st.session_state.chatInput
@@ -91,8 +118,8 @@ class CasePage():
         prefix = f"case{self.currentCase.caseNum}Question"
         prompt = f"Part {st.session_state.currentStage} \n"
         for idx, key in enumerate(sorted([key for key in st.session_state.keys() if prefix in key])):
-            question = self.currentCase.questions[f'stage{st.session_state.currentStage}'][idx]['question']
-            answer = self.currentCase.questions[f'stage{st.session_state.currentStage}'][idx]['answer']
+            question = self.currentCase.questions[f'stage{st.session_state.currentStage}'][idx].question
+            answer = self.currentCase.questions[f'stage{st.session_state.currentStage}'][idx].answer
             result = f"Question {idx + 1}: {question}\nCorrect answer: {answer}\nUser answer: {st.session_state[key]}\n\n"
             prompt += result
         prompt += f"Evaluate the above questions as instructed in system message, with reference to context from case {self.currentCase.caseNum}."
@@ -101,7 +128,7 @@ class CasePage():
                 response = st.write_stream(updateConversation(prompt))
                 self.updateChatHistory(role="assistant", content=response)
         st.session_state.currentStage = st.session_state.currentStage + 1
-        print(f"casePage script: {st.session_state.currentStage}")
+        logger.debug(f"Case {self.currentCase.caseNum} advanced to stage {st.session_state.currentStage}")
 
     def clearAllAnswers(self) -> None:
         prefix = f"case{self.currentCase.caseNum}Question"
@@ -109,11 +136,12 @@ class CasePage():
             st.session_state[key] = ""
 
     def clearConversation(self) -> None:
-        # st.session_state.sessionID =
-        st.session_state.sessionID = 2514216  # getNewConversationID()
-        st.session_state.messages = [
-            {"role": "assistant", "content": "Hi, I'm Dr. ChestXpert. You can submit your answers for this case to me, and I'll evaluate how well you did! I can also answer questions related to lines and tubes on CXRs as well."}]
+        st.session_state.sessionID = None  # a new conversation is created on the next message
+        st.session_state.pagesShown = 0
+        st.session_state.messages = Transcript(
+            "Hi, I'm Dr. ChestXpert. You can submit your answers for this case to me, and I'll evaluate how well you did! I can also answer questions related to lines and tubes on CXRs as well.",
+            pageSize=st.session_state.messages.pageSize)
 
     def addStage(self):
         st.session_state.currentStage += 1
-        print(st.session_state.currentStage)
+        logger.debug(f"Case {self.currentCase.caseNum} advanced to stage {st.session_state.currentStage}")
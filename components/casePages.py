@@ -0,0 +1,28 @@
+import streamlit as st
+
+from components.langchainCasePage import LangChainCasePage
+from schema.registry import CaseRegistry
+
+
+@st.cache_resource(show_spinner=False)
+def getCaseRegistry() -> CaseRegistry:
+    return CaseRegistry()
+
+
+def makeCasePage(caseNum: int):
+    """Page function for one case, looked up in the registry on each run."""
+    def casePage():
+        case = getCaseRegistry().get(caseNum)
+        if case is None or not case.published:
+            st.write('Under construction :(')
+            return
+        if st.session_state.currentCase != caseNum:
+            st.session_state.currentStage = 1
+            st.session_state.currentCase = caseNum
+        LangChainCasePage(case)
+    return casePage
+
+
+def getCasePages() -> list:
+    return [st.Page(makeCasePage(case.caseNum), title=f"Game {case.caseNum}", url_path=f"case{case.caseNum}")
+            for case in getCaseRegistry().cases()]
@@ -0,0 +1,123 @@
+# Size-appropriate variants of the case images, generated once per source file.
+# A JPEG "preview" (the width shown in the CXR Images tab) is written under `variantDir`, keyed by
+# the source file's mtime, and only regenerated when the source changes. The "full" image is the
+# source file's own bytes, never re-encoded, so no detail is lost when a student zooms in. Bytes are
+# kept in a process-wide LRU cache bounded in bytes, so a rerun neither reads nor decodes an image;
+# full resolution is only read when asked for.
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Tuple
+
+import streamlit as st
+from PIL import Image
+
+from chatbot.settings import get_setting
+from schema.schema import CaseImage
+
+logger = logging.getLogger(__name__)
+
+# Generated variant name -> longest side in pixels
+VARIANTS: Dict[str, int] = {"preview": 768}
+# Variant served straight from the source file
+ORIGINAL = "full"
+
+
+class ImageAssets():
+    def __init__(self, variantDir: str = "./data/image_variants", maxBytes: int = 64 * 1024 * 1024,
+                 quality: int = 85):
+        self.variantDir = variantDir
+        self.maxBytes = maxBytes
+        self.quality = quality
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[Tuple[str, str, int], bytes]" = OrderedDict()
+        self._cachedBytes = 0
+        self._lock = threading.Lock()
+
+    def variantPath(self, path: str, variant: str, mtime: int) -> str:
+        digest = hashlib.sha256(f"{os.path.abspath(path)}:{mtime}".encode("utf-8")).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.variantDir, f"{name}-{digest}-{variant}.jpg")
+
+    def encode(self, path: str, variant: str) -> bytes:
+        """Resize and JPEG-encode one variant. Transparency is flattened onto black, like the film."""
+        with Image.open(path) as source:
+            image = source.convert("RGBA") if source.mode in ("P", "LA", "RGBA") else source.convert("RGB")
+            if image.mode == "RGBA":
+                background = Image.new("RGB", image.size, (0, 0, 0))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            longest = VARIANTS[variant]
+            if max(image.size) > longest:
+                image.thumbnail((longest, longest), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=self.quality, optimize=True, progressive=True)
+        return buffer.getvalue()
+
+    def prepare(self, images: Iterable[CaseImage]) -> int:
+        """Write any missing variants to disk. Returns the number generated."""
+        generated = 0
+        os.makedirs(self.variantDir, exist_ok=True)
+        for image in images:
+            mtime = os.stat(image.path).st_mtime_ns
+            for variant in VARIANTS:
+                target = self.variantPath(image.path, variant, mtime)
+                if os.path.exists(target):
+                    continue
+                data = self.encode(image.path, variant)
+                with open(f"{target}.tmp", "wb") as file:
+                    file.write(data)
+                os.replace(f"{target}.tmp", target)
+                generated += 1
+                logger.info(f"Generated {variant} variant of {image.path} ({len(data) // 1024} KiB)")
+        return generated
+
+    def get(self, image: CaseImage, variant: str = "preview") -> bytes:
+        """Encoded bytes of one variant (or of the source file for ORIGINAL), from memory when possible."""
+        mtime = os.stat(image.path).st_mtime_ns
+        key = (image.path, variant, mtime)
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        if variant == ORIGINAL:
+            target = image.path
+        else:
+            target = self.variantPath(image.path, variant, mtime)
+            if not os.path.exists(target):
+                self.prepare([image])
+        with open(target, "rb") as file:
+            data = file.read()
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = data
+                self._cachedBytes += len(data)
+            while self._cachedBytes > self.maxBytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cachedBytes -= len(evicted)
+        return data
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"entries": len(self._cache), "bytes": self._cachedBytes, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+@st.cache_resource(show_spinner=False)
+def getImageAssets() -> ImageAssets:
+    from components.casePages import getCaseRegistry
+    assets = ImageAssets(variantDir=get_setting("IMAGE_VARIANT_PATH", "./data/image_variants"),
+                         maxBytes=get_setting("IMAGE_CACHE_MB", 64) * 1024 * 1024)
+    # Generate every declared image's variants once at startup rather than on a student's first visit
+    try:
+        assets.prepare(image for case in getCaseRegistry().cases() for image in case.images)
+    except Exception as e:
+        logger.error(f"Could not prepare case images: {e}")
+    return assets
@@ -1,67 +1,133 @@
 import time
+import logging
+from typing import List, Optional, Tuple
+
 import streamlit as st
 
-from langchain_core.messages import RemoveMessage
-from langchain_core.messages.ai import AIMessageChunk
+from langchain_core.messages.ai import AIMessage
 from langchain_core.messages.human import HumanMessage
 
+from chatbot.answer_cache import CachedAnswer, prompt_version, replay, shareable_sources
+from chatbot.context import stage_message
+from chatbot.executor import QueueFullError
+from chatbot.resources import get_answer_cache, get_embeddings, get_executor, get_stage_evaluator
+from chatbot.settings import get_setting
+from chatbot.streaming import StreamStats, coalesce_stream
+from chatbot.threads import load_system_prompt, start_thread, thread_registry
 from .casePage import CasePage
+from .transcript import Transcript
 from schema.schema import Case
 
+logger = logging.getLogger(__name__)
+
+BUSY_MESSAGE = "Dr. XRLiA is busy with other students right now, please try again in a moment."
+GREETING = "Hi, I'm Dr.XRLiA. You can submit your answers for this case to me and I'll evaluate them! \n Feel free to ask me questions related to lines and tubes on CXRs as well."
+
 
 class LangChainCasePage(CasePage):
     def __init__(self, case: Case):
+        self.config = st.session_state.lcConfig
         super().__init__(case)
-        self.config = {
-            "configurable": {
-                "thread_id": "abc123",
-            }
-        }
-        graph = st.session_state.graph
-        chat_history = graph.get_state(self.config).values["messages"]
-        for message in chat_history:
-            message.pretty_print()
 
     def clearConversation(self) -> None:
-        chat_history = st.session_state.graph.get_state(self.config).values["messages"]
-        st.session_state.graph.update_state(config=self.config, values={
-                                            "messages": [RemoveMessage(id=m.id) for m in chat_history[1:]]})
-        st.session_state.messages = [
-            {"role": "assistant", "content": "Hi, I'm Dr.XRLiA. You can submit your answers for this case to me and I'll evaluate them! \n Feel free to ask me questions related to lines and tubes on CXRs as well."}]
+        # Start a fresh thread rather than deleting messages from the old one
+        thread_registry.expire(st.session_state.threadID)
+        thread = start_thread(st.session_state.graph, thread_registry)
+        st.session_state.threadID = thread.thread_id
+        st.session_state.lcConfig = thread.config
+        self.config = thread.config
+        st.query_params["thread"] = thread.thread_id
+        st.session_state.pagesShown = 0
+
+    def transcript(self) -> Transcript:
+        # Derived from the checkpoint on every render; the graph thread is the only message store
+        messages = st.session_state.graph.get_state(self.config).values.get("messages", [])
+        return Transcript.fromMessages(messages, GREETING, pageSize=get_setting("TRANSCRIPT_PAGE_SIZE", 20))
+
+    def updateChatHistory(self, role: str, content: str) -> None:
+        # Every turn is already in the checkpoint, which the next render reads
+        pass
 
     def getMessageContent(self, generator):
-        for chunk in generator:
-            # chunk is tuple(MessageChunk, dict(model_params))
-            print(type(chunk[0]), type(chunk[1]))
-            time.sleep(0.05)
-            if isinstance(chunk[0], AIMessageChunk):
-                yield chunk[0].content
+        # generator yields tuple(MessageChunk, dict(metadata))
+        st.session_state.lastStreamStats = StreamStats(started=time.perf_counter())
+        yield from coalesce_stream(generator, stats=st.session_state.lastStreamStats)
+
+    def lookupCachedAnswer(self, prompt: str) -> Tuple[Optional[CachedAnswer], Optional[List[float]]]:
+        """Cached answer to the same question at this case and stage, plus the question's embedding."""
+        cache = get_answer_cache()
+        cache.check_version(prompt_version(load_system_prompt()))
+        caseNum, stage = self.currentCase.caseNum, st.session_state.currentStage
+        cached = cache.get_exact(caseNum, stage, prompt)
+        if cached is not None:
+            return cached, None
+        try:
+            embedding = get_embeddings().embed_query(prompt)
+        except Exception as e:
+            logger.error(f"Could not embed question for the answer cache: {e}")
+            return None, None
+        return cache.get_similar(caseNum, stage, embedding), embedding
+
+    def storeAnswer(self, prompt: str, embedding: Optional[List[float]], response: str) -> None:
+        # Answers shaped by this student's earlier questions or ungrounded in the guides stay private
+        sources = shareable_sources(st.session_state.graph.get_state(self.config).values["messages"])
+        if sources is None:
+            return
+        get_answer_cache().put(self.currentCase.caseNum, st.session_state.currentStage, prompt, embedding,
+                               response, sources)
 
-    def onSubmitNewPrompt(self, prompt: str = "", showUserPrompt: bool = True) -> None:
+    def onSubmitNewPrompt(self, prompt: str = "", showUserPrompt: bool = True, stage: Optional[int] = None) -> bool:
+        """Run one turn. Returns False when the turn could not be run, e.g. because the executor is full."""
         if prompt == "":
             prompt = st.session_state.chatInput
         if showUserPrompt:
             self.updateChatHistory(role="user", content=prompt)
+        # Free-text questions may be answered from the cohort-wide answer cache (opt-in)
+        useCache = stage is None and get_setting("ANSWER_CACHE", False)
+        cached, embedding = self.lookupCachedAnswer(prompt) if useCache else (None, None)
         with self.chatContainer:
             if showUserPrompt:
                 with st.chat_message("user"):
                     st.markdown(prompt)
             with st.chat_message("assistant"):
-                response = st.write_stream(self.getMessageContent(st.session_state.graph.stream(
-                    {"messages": [HumanMessage(prompt)]}, config=self.config, stream_mode="messages")))
+                message = HumanMessage(prompt) if stage is None else stage_message(prompt, stage)
+                if cached is not None:
+                    response = st.write_stream(replay(cached.answer))
+                    # Record the exchange in the thread so follow-up questions keep their context
+                    st.session_state.graph.update_state(self.config, {"messages": [message, AIMessage(
+                        cached.answer, additional_kwargs={"sources": cached.sources, "cached": True})]},
+                        as_node="generate")
+                    self.updateChatHistory(role="assistant", content=response)
+                    return True
+                try:
+                    # Runs on the shared executor so concurrent students are scheduled fairly
+                    chunks = get_executor().stream(st.session_state.threadID, st.session_state.graph,
+                                                   {"messages": [message]}, config=self.config)
+                    response = st.write_stream(self.getMessageContent(chunks))
+                except QueueFullError:
+                    st.warning(BUSY_MESSAGE)
+                    return False
+                except Exception as e:
+                    # A failed turn (e.g. every model tier down) is re-raised here by the executor
+                    logger.error(f"Turn failed: {e}")
+                    st.warning(BUSY_MESSAGE)
+                    return False
             # response = st.session_state.graph.invoke(
             # {"messages": [HumanMessage(prompt)]}, config=self.config)
+        if useCache and isinstance(response, str) and response:
+            self.storeAnswer(prompt, embedding, response)
         self.updateChatHistory(role="assistant", content=response)
+        return True
 
     def onSubmitScenarioForm(self) -> None:
-        prefix = f"case{self.currentCase.caseNum}Question"
-        prompt = f"Stage {st.session_state.currentStage} \n"
-        for idx, key in enumerate(sorted([key for key in st.session_state.keys() if prefix in key])):
-            question = self.currentCase.questions[f'stage{st.session_state.currentStage}'][idx]['question']
-            answer = self.currentCase.questions[f'stage{st.session_state.currentStage}'][idx]['answer']
-            result = f"Question {idx + 1}: {question}\nCorrect answer: {answer}\nUser answer: {st.session_state[key]}\n\n"
-            prompt += result
-        prompt += f"Evaluate the above questions as instructed in system message, with reference to context from case {self.currentCase.caseNum}."
-        self.onSubmitNewPrompt(prompt, False)
+        stage = st.session_state.currentStage
+        questions = self.currentCase.questions[f'stage{stage}']
+        answers = [st.session_state.get(f"case{self.currentCase.caseNum}Question{idx + 1}", "")
+                   for idx in range(len(questions))]
+        evaluator = get_stage_evaluator(self.currentCase.caseNum, self.currentCase.version, self.currentCase)
+        prompt = evaluator.build_submission(stage, answers)
+        if not self.onSubmitNewPrompt(prompt, False, stage=stage):
+            # Not graded, so the student stays on this stage and can submit again
+            return None
         st.session_state.currentStage = st.session_state.currentStage + 1
-        print(f"casePage script: {st.session_state.currentStage}")
+        logger.debug(f"Case {self.currentCase.caseNum} advanced to stage {st.session_state.currentStage}")
@@ -1,52 +1,119 @@
 # For communication with CustomGPT API
-import os
+import json
 import time
+import logging
+from typing import Iterable, Iterator
+
 import requests
-import json
 import streamlit as st
-from sseclient import SSEClient
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from chatbot.settings import get_setting
+from chatbot.tracing import metrics, record_span, span
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = "https://app.customgpt.ai/api/v1"
+
+
+class IdempotentRetry(Retry):
+    """Retries POSTs on 429 only. A 429 means the request was not processed, whereas a 502/503/504
+    from a gateway may come after the upstream already accepted the message."""
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method.upper() == "POST" and status_code != 429:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
 
+def parseServerSentEvents(lines: Iterable[str]) -> Iterator[dict]:
+    """JSON payloads of a text/event-stream. "data:" lines accumulate until a blank line ends the
+    event; an event still pending when the stream ends is emitted too."""
+    data = []
+    for line in lines:
+        if line:
+            if line.startswith("data:"):
+                data.append(line[5:].lstrip())
+            continue
+        if data:
+            yield json.loads("\n".join(data))
+            data = []
+    if data:
+        yield json.loads("\n".join(data))
 
-def getAuthToken() -> str:
-    API_KEY = st.secrets['CUSTOMGPT_API_KEY']
-    return f"Bearer {API_KEY}"
+
+class CustomGPTClient():
+    """Keep-alive client for the CustomGPT API, shared by all sessions.
+
+    Connections are pooled in one requests.Session. Failed connects are retried with backoff, as
+    are 429 responses (honouring Retry-After) and, for GETs, 502/503/504. Reads are never retried
+    and a POST is only resent after a 429, so a message is not sent twice once the server may have
+    accepted it.
+    """
+
+    def __init__(self, apiKey: str, projectID: str, connectTimeout: float = 3.05, readTimeout: float = 60.0,
+                 retries: int = 3, poolSize: int = 10):
+        self.projectID = projectID
+        self.timeout = (connectTimeout, readTimeout)
+        retry = IdempotentRetry(total=retries, connect=retries, read=0, status=retries, backoff_factor=0.5,
+                      status_forcelist=(429, 502, 503, 504), allowed_methods=frozenset({"GET", "POST"}),
+                      respect_retry_after_header=True, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "accept": "application/json",
+            "content-type": "application/json",
+            "authorization": f"Bearer {apiKey}",
+        })
+
+    def createConversation(self, name: str = "case-simulation") -> str:
+        url = f"{BASE_URL}/projects/{self.projectID}/conversations"
+        with span("customgpt", "create_conversation"):
+            response = self.session.post(url, json={"name": name}, timeout=self.timeout)
+        response.raise_for_status()
+        return str(response.json()['data']['id'])
+
+    def streamMessage(self, sessionID: str, prompt: str) -> Iterator[str]:
+        """Send a prompt and yield the answer's text chunks as the server streams them."""
+        url = f"{BASE_URL}/projects/{self.projectID}/conversations/{sessionID}/messages"
+        start = time.perf_counter()
+        attributes = {"chunks": 0}
+        try:
+            with self.session.post(url, params={"stream": "true"}, json={"prompt": prompt},
+                                   timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                for event in parseServerSentEvents(response.iter_lines(decode_unicode=True)):
+                    if event.get('status') == "progress":
+                        if not attributes["chunks"]:
+                            attributes["ttft"] = round(time.perf_counter() - start, 4)
+                            metrics.observe("chatbot_ttft_seconds", attributes["ttft"], backend="customgpt")
+                        attributes["chunks"] += 1
+                        yield event['message']
+        except Exception as e:
+            attributes["error"] = type(e).__name__
+            raise
+        finally:
+            record_span("customgpt", "message", start, time.perf_counter() - start, **attributes)
+
+
+@st.cache_resource(show_spinner=False)
+def getClient() -> CustomGPTClient:
+    return CustomGPTClient(apiKey=get_setting('CUSTOMGPT_API_KEY'), projectID=get_setting('CUSTOMGPT_PRJ_ID'),
+                           connectTimeout=get_setting('CUSTOMGPT_CONNECT_TIMEOUT', 3.05),
+                           readTimeout=get_setting('CUSTOMGPT_READ_TIMEOUT', 60.0),
+                           retries=get_setting('CUSTOMGPT_RETRIES', 3))
 
 
 def getNewConversationID() -> str:
-    projectID = st.secrets['CUSTOMGPT_PRJ_ID']
-    authToken = getAuthToken()
-    url = f"https://app.customgpt.ai/api/v1/projects/{projectID}/conversations"
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "authorization": authToken
-    }
-    data = {
-        "name": "test-convo"
-    }
-    response = requests.post(url, json=data, headers=headers)
-    responseObj = json.loads(response.text)
-    print(responseObj)
-    return str(responseObj['data']['id'])
-
-
-def updateConversation(prompt: str):
-    projectID = st.secrets['CUSTOMGPT_PRJ_ID']
-    sessionID = st.session_state.sessionID
-    authToken = getAuthToken()
-    url = f"https://app.customgpt.ai/api/v1/projects/{projectID}/conversations/{sessionID}/messages?stream=true"
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "authorization": authToken
-    }
-    data = {
-        "prompt": prompt
-    }
-    response = requests.post(url, json=data, headers=headers, stream=True)
-    client = SSEClient(response)
-    for event in client.events():
-        eventJSON = json.loads(event.data)
-        if eventJSON['status'] == "progress":
-            yield eventJSON['message']
-            time.sleep(0.05)
+    conversationID = getClient().createConversation()
+    logger.info(f"Created CustomGPT conversation {conversationID}")
+    return conversationID
+
+
+def updateConversation(prompt: str) -> Iterator[str]:
+    # The conversation is created on the first message of a session, not on page load
+    if st.session_state.get('sessionID') is None:
+        st.session_state.sessionID = getNewConversationID()
+    yield from getClient().streamMessage(st.session_state.sessionID, prompt)
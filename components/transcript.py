@@ -0,0 +1,92 @@
+# Paged view of a chat conversation for the case pages.
+# The LangChain case pages keep no message store of their own: each render builds the view from
+# the graph checkpoint with `Transcript.fromMessages`, so trimmed turns and cached answers show up
+# exactly as the graph holds them. The CustomGPT page, whose history lives on the CustomGPT server,
+# appends to a session Transcript capped at `maxRecords`. Only the latest messages are drawn as
+# chat bubbles; earlier ones are split into fixed pages that are only joined and drawn when the
+# student asks for earlier messages.
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+ROLE_NAMES = {"user": "You", "assistant": "Dr. XRLiA"}
+
+
+@dataclass(frozen=True, slots=True)
+class ChatRecord():
+    role: str
+    content: str
+
+    @property
+    def markdown(self) -> str:
+        """The message as one block of a collapsed transcript page."""
+        return f"**{ROLE_NAMES.get(self.role, self.role)}:** {self.content}"
+
+
+class Transcript():
+    """List of chat records with paged, windowed rendering.
+
+    Args:
+        greeting: First assistant message, if any.
+        pageSize: Messages per collapsed page; between `pageSize` and 2 * `pageSize` - 1 of the
+            latest messages are drawn as bubbles.
+        maxRecords: Records kept when appending; the oldest full pages are dropped beyond it.
+    """
+
+    def __init__(self, greeting: Optional[str] = None, pageSize: int = 20, maxRecords: int = 1000):
+        self.pageSize = max(1, pageSize)
+        self.maxRecords = max(maxRecords, 2 * self.pageSize)
+        self._records: List[ChatRecord] = []
+        self._pages: Dict[int, str] = {}
+        if greeting:
+            self.append("assistant", greeting)
+
+    @classmethod
+    def fromMessages(cls, messages: Iterable[Any], greeting: Optional[str] = None, pageSize: int = 20) -> "Transcript":
+        """Transcript of a graph thread: the student's questions and the tutor's answers.
+
+        Stage submissions, tool calls and tool results are not shown in the chat, so they are skipped.
+        Turns already folded into the running summary are no longer in the checkpoint and are not shown.
+        """
+        transcript = cls(greeting, pageSize)
+        for message in messages:
+            if message.type == "human" and message.additional_kwargs.get("stage") is None:
+                transcript.append("user", message.content)
+            elif message.type == "ai" and message.content and not message.tool_calls:
+                transcript.append("assistant", message.content)
+        return transcript
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[ChatRecord]:
+        return iter(self._records)
+
+    def append(self, role: str, content) -> ChatRecord:
+        record = ChatRecord(role, content if isinstance(content, str) else "".join(map(str, content)))
+        self._records.append(record)
+        if len(self._records) > self.maxRecords:
+            del self._records[:self.pageSize]
+            self._pages.clear()
+        return record
+
+    @property
+    def pageCount(self) -> int:
+        """Number of collapsed pages before the recent window."""
+        return max(0, (len(self._records) - self.pageSize) // self.pageSize)
+
+    def recent(self) -> List[ChatRecord]:
+        return self._records[self.pageCount * self.pageSize:]
+
+    def page(self, idx: int) -> str:
+        """Joined markdown of collapsed page `idx` (0 is the oldest). Full pages never change, so it is built once."""
+        markdown = self._pages.get(idx)
+        if markdown is None:
+            records = self._records[idx * self.pageSize:(idx + 1) * self.pageSize]
+            markdown = "\n\n---\n\n".join(record.markdown for record in records)
+            self._pages[idx] = markdown
+        return markdown
+
+    def shownPages(self, pagesShown: int) -> List[str]:
+        """Markdown of the `pagesShown` newest collapsed pages, oldest first."""
+        count = self.pageCount
+        return [self.page(idx) for idx in range(max(0, count - pagesShown), count)]
@@ -1,8 +1,19 @@
+import os
+
 import streamlit as st
 import yaml
 
-with open('./data/home.yml', 'r') as file:
-    content = yaml.safe_load(file)['home']
+HOME_PATH = './data/home.yml'
+
+
+@st.cache_data(show_spinner=False)
+def loadHomeContent(path: str, mtime: float) -> dict:
+    # mtime is part of the cache key so edits to home.yml are picked up
+    with open(path, 'r') as file:
+        return yaml.safe_load(file)['home']
+
+
+content = loadHomeContent(HOME_PATH, os.path.getmtime(HOME_PATH))
 
 st.title("CUHK DIIR Case Simulation Chatbot Demo")
 st.subheader("Description")
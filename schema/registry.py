@@ -0,0 +1,122 @@
+# Discovers and validates every data/cases/*.yml once and keeps the parsed cases in memory.
+# Files are re-read only when their mtime changes, and the directory is checked at most every
+# `reloadInterval` seconds, so a rerun does not touch the filesystem or YAML parser at all.
+# A file that fails to parse or validate (e.g. one saved halfway through an edit) is logged and
+# its last good version stays live; a new file that has never been valid is skipped.
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from .schema import Case, CaseImage, Question
+
+logger = logging.getLogger(__name__)
+
+
+class CaseValidationError(ValueError):
+    pass
+
+
+def parseCase(path: str) -> Case:
+    with open(path, 'rb') as file:
+        fileBytes = file.read()
+    content = yaml.safe_load(fileBytes)
+    if not isinstance(content, dict) or not isinstance(content.get('case'), dict):
+        raise CaseValidationError(f"{path}: missing top-level 'case' mapping")
+    raw = content['case']
+    for field in ('caseNum', 'caseDesc', 'maxStage', 'questions'):
+        if field not in raw:
+            raise CaseValidationError(f"{path}: missing '{field}'")
+    maxStage = raw['maxStage']
+    stageKeys = sorted(raw['questions'] or {})
+    expected = sorted(f"stage{idx}" for idx in range(1, maxStage + 1))
+    if stageKeys != expected:
+        raise CaseValidationError(f"{path}: maxStage is {maxStage} but questions has stages {stageKeys}")
+    questions = {}
+    for stageKey in expected:
+        items = raw['questions'][stageKey] or []
+        if not items:
+            raise CaseValidationError(f"{path}: {stageKey} has no questions")
+        for idx, item in enumerate(items):
+            if not isinstance(item, dict) or not str(item.get('question') or '').strip() \
+                    or not str(item.get('answer') or '').strip():
+                raise CaseValidationError(f"{path}: {stageKey} question {idx + 1} needs a question and an answer")
+        questions[stageKey] = tuple(Question(str(item['question']), str(item['answer'])) for item in items)
+    images = []
+    for idx, item in enumerate(raw.get('images') or []):
+        if not isinstance(item, dict) or not str(item.get('path') or '').strip():
+            raise CaseValidationError(f"{path}: image {idx + 1} needs a path")
+        if not os.path.isfile(item['path']):
+            raise CaseValidationError(f"{path}: image {idx + 1} not found at {item['path']}")
+        images.append(CaseImage(str(item['path']), str(item.get('caption') or ''), str(item.get('credit') or '')))
+    return Case(caseNum=int(raw['caseNum']), caseDesc=raw['caseDesc'], maxStage=maxStage,
+                questions=MappingProxyType(questions), published=bool(raw.get('published', True)),
+                images=tuple(images), version=hashlib.sha256(fileBytes).hexdigest()[:16])
+
+
+class CaseRegistry():
+    def __init__(self, pattern: str = "./data/cases/*.yml", reloadInterval: float = 2.0):
+        self.pattern = pattern
+        self.reloadInterval = reloadInterval
+        self._files: Dict[str, Tuple[float, Case]] = {}
+        self.errors: Dict[str, str] = {}  # path -> why its current version was rejected
+        self._rejected: Dict[str, float] = {}  # path -> mtime of the rejected version
+        self._cases: Tuple[Case, ...] = ()
+        self._checkedAt = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def refresh(self, force: bool = False) -> None:
+        """Re-parse case files whose mtime changed, keeping the last good version of any invalid file."""
+        now = time.monotonic()
+        if not force and now - self._checkedAt < self.reloadInterval:
+            return
+        with self._lock:
+            self._checkedAt = now
+            files = {}
+            for path in sorted(glob.glob(self.pattern)):
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue  # deleted since the glob
+                cached = self._files.get(path)
+                if cached is not None and cached[0] == mtime or self._rejected.get(path) == mtime:
+                    if cached is not None:
+                        files[path] = cached
+                    continue
+                try:
+                    files[path] = (mtime, parseCase(path))
+                except (CaseValidationError, yaml.YAMLError, OSError, TypeError, ValueError) as e:
+                    self._rejected[path] = mtime
+                    self.errors[path] = str(e)
+                    logger.error(f"Invalid case file {path}, {'keeping its last good version' if cached else 'skipping it'}: {e}")
+                    if cached is not None:
+                        files[path] = cached
+                    continue
+                self._rejected.pop(path, None)
+                self.errors.pop(path, None)
+            if files == self._files:
+                return
+            cases, seen = [], {}
+            for path, (_, case) in files.items():
+                if case.caseNum in seen:
+                    logger.error(f"Duplicate caseNum {case.caseNum} in {path}, already used by {seen[case.caseNum]}; skipping it")
+                    continue
+                seen[case.caseNum] = path
+                cases.append(case)
+            self._files = files
+            self._cases = tuple(sorted(cases, key=lambda case: case.caseNum))
+
+    def cases(self) -> List[Case]:
+        self.refresh()
+        return list(self._cases)
+
+    def get(self, caseNum: int) -> Optional[Case]:
+        self.refresh()
+        return next((case for case in self._cases if case.caseNum == caseNum), None)
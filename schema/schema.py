@@ -1,9 +1,26 @@
 from dataclasses import dataclass
+from typing import Mapping, Tuple
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class Question():
+    question: str
+    answer: str
+
+
+@dataclass(frozen=True, slots=True)
+class CaseImage():
+    path: str
+    caption: str = ""
+    credit: str = ""  # markdown
+
+
+@dataclass(frozen=True, slots=True)
 class Case():
     caseNum: int
     caseDesc: str
     maxStage: int
-    questions: dict
+    questions: Mapping[str, Tuple[Question, ...]]  # "stage1" .. f"stage{maxStage}"
+    published: bool = True
+    images: Tuple[CaseImage, ...] = ()
+    version: str = ""  # hash of the case file, changes whenever it is edited
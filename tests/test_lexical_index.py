@@ -0,0 +1,64 @@
+from langchain_core.documents import Document
+
+from chatbot.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def chunk(text: str, source: str = "guide.md", chunk_id: str = None) -> Document:
+    metadata = {"source": source}
+    if chunk_id:
+        metadata["chunk_id"] = chunk_id
+    return Document(text, metadata=metadata)
+
+
+def test_tokenize_drops_stopwords_and_plurals():
+    assert tokenize("The tips of the NG tubes are below the carina") == ["tip", "ng", "tube", "below", "carina"]
+
+
+def test_rrf_ranks_documents_found_by_both_lists_first():
+    a, b, c = chunk("a", chunk_id="a"), chunk("b", chunk_id="b"), chunk("c", chunk_id="c")
+    fused = reciprocal_rank_fusion([[a, b], [c, b]], k=3)
+    assert [doc.metadata["chunk_id"] for doc in fused] == ["b", "a", "c"]
+
+
+def test_rrf_dedupes_by_chunk_id_and_truncates():
+    first = chunk("same text", chunk_id="x")
+    copy = chunk("same text, other object", chunk_id="x")
+    fused = reciprocal_rank_fusion([[first, chunk("y", chunk_id="y")], [copy]], k=1)
+    assert fused == [first]
+
+
+def test_rrf_of_no_rankings_is_empty():
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+def test_search_ranks_by_bm25():
+    index = LexicalIndex()
+    index.sync([chunk("The ETT tip should sit 5 cm above the carina."),
+                chunk("An NG tube tip belongs in the stomach."),
+                chunk("Check the carina, the carina level is T4.", source="other.md")])
+    results = index.search("carina", k=4)
+    assert [doc.page_content for doc, _ in results] == ["Check the carina, the carina level is T4.",
+                                                        "The ETT tip should sit 5 cm above the carina."]
+    assert results[0][1] > results[1][1] > 0
+    assert all(doc.metadata["chunk_id"] == doc.id for doc, _ in results)
+    assert index.search("pneumothorax") == []
+
+
+def test_sync_replaces_only_the_sources_it_is_given():
+    index = LexicalIndex()
+    assert index.sync([chunk("carina level", "a.md"), chunk("stomach bubble", "b.md")]) == (2, 0)
+    assert index.sync([chunk("carina level", "a.md"), chunk("new text about the carina", "a.md")]) == (1, 0)
+    assert index.sync([chunk("new text about the carina", "a.md")]) == (0, 1)
+    assert index.sync([chunk("new text about the carina", "a.md")]) == (0, 0)
+    assert sorted(doc.metadata["source"] for doc, _ in index.search("carina stomach")) == ["a.md", "b.md"]
+    assert index.remove_sources(["b.md"]) == 1
+    assert len(index) == 1
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = LexicalIndex(path=str(tmp_path))
+    index.sync([chunk("The ETT tip should sit 5 cm above the carina."), chunk("An NG tube tip in the stomach.")])
+    loaded = LexicalIndex.load(str(tmp_path))
+    assert len(loaded) == 2
+    assert loaded.search("stomach") and loaded.search("stomach")[0][0].page_content == "An NG tube tip in the stomach."
+    assert loaded.is_keyword_query("NG tube")
@@ -0,0 +1,46 @@
+from langchain_core.documents import Document
+
+from chatbot.local_index import LocalVectorStore, StubEmbeddings
+from chatbot.manifest import ChunkManifest, chunk_ids
+
+
+def chunks(source: str, *texts: str):
+    return [Document(text, metadata={"source": source}) for text in texts]
+
+
+def test_chunk_ids_are_stable_and_unique_per_occurrence():
+    ids = chunk_ids("a.md", chunks("a.md", "same", "other", "same"))
+    assert ids == chunk_ids("a.md", chunks("a.md", "same", "other", "same"))
+    assert len(set(ids)) == 3 and ids[2] == f"{ids[0]}-1"
+    assert chunk_ids("b.md", chunks("b.md", "same"))[0] != ids[0]
+
+
+def test_sync_adds_new_chunks_and_deletes_removed_ones(tmp_path):
+    store = LocalVectorStore(StubEmbeddings())
+    manifest = ChunkManifest(str(tmp_path / "manifest.json"))
+    first = manifest.sync(store, chunks("a.md", "one", "two") + chunks("b.md", "three"))
+    assert len(first.added) == 3 and first.deleted == [] and len(store) == 3
+
+    second = manifest.sync(store, chunks("a.md", "one", "changed"))
+    assert second.unchanged == 1 and len(second.added) == 1 and len(second.deleted) == 1
+    # b.md was not part of the sync, so it is left alone
+    indexed = store.get_by_ids(manifest.known_ids("a.md") + manifest.known_ids("b.md"))
+    assert sorted(doc.page_content for doc in indexed) == ["changed", "one", "three"]
+    assert len(store) == 3
+    assert store.get_by_ids(second.added)[0].metadata["chunk_id"] == second.added[0]
+
+
+def test_sync_is_persisted(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    store = LocalVectorStore(StubEmbeddings())
+    ChunkManifest(path).sync(store, chunks("a.md", "one", "two"))
+    result = ChunkManifest(path).sync(store, chunks("a.md", "one", "two"))
+    assert result.added == [] and result.deleted == [] and result.unchanged == 2
+
+
+def test_untracked_lists_vectors_indexed_before_the_manifest(tmp_path):
+    store = LocalVectorStore(StubEmbeddings())
+    legacy = store.add_texts(["legacy chunk"], metadatas=[{"source": "data/src_docs/a.txt"}])
+    manifest = ChunkManifest(str(tmp_path / "manifest.json"))
+    result = manifest.sync(store, chunks("a.md", "one"))
+    assert manifest.untracked(legacy + result.added) == legacy
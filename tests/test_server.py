@@ -0,0 +1,31 @@
+import pytest
+
+from components.server import IdempotentRetry, parseServerSentEvents
+
+
+def test_events_end_at_blank_lines():
+    lines = ['data: {"status": "progress", "message": "Hel"}', "", "event: ping", "",
+             'data: {"status": "progress", "message": "lo"}', ""]
+    assert [event["message"] for event in parseServerSentEvents(lines)] == ["Hel", "lo"]
+
+
+def test_multiline_data_is_joined():
+    assert list(parseServerSentEvents(['data: {"status":', 'data: "finish"}', ""])) == [{"status": "finish"}]
+
+
+def test_last_event_is_flushed_without_a_trailing_blank_line():
+    lines = ['data: {"status": "progress"}', "", 'data: {"status": "finish"}']
+    assert [event["status"] for event in parseServerSentEvents(lines)] == ["progress", "finish"]
+
+
+def test_comment_and_field_lines_are_ignored():
+    assert list(parseServerSentEvents([": keep-alive", "id: 3", "", ""])) == []
+
+
+@pytest.mark.parametrize("method, status, retried", [
+    ("POST", 429, True), ("POST", 502, False), ("POST", 503, False),
+    ("GET", 429, True), ("GET", 503, True), ("GET", 500, False),
+])
+def test_posts_are_only_retried_after_429(method, status, retried):
+    retry = IdempotentRetry(total=3, status_forcelist=(429, 502, 503, 504), allowed_methods=frozenset({"GET", "POST"}))
+    assert retry.is_retry(method, status) is retried